@@ -0,0 +1,210 @@
+#!python3
+"""
+Offline benchmark: generates reproducible test releases with ffmpeg's lavfi sources and runs them through every
+stage of the scripts, uploading to a local stand-in for the image hosts. Reports wall time, spawned subprocesses,
+bytes written and peak RSS per stage, and can save or compare against a baseline.
+
+    py Benchmark.py --ffmpeg /usr/bin/ffmpeg --mediainfo /usr/bin/mediainfo [--save-baseline base.json]
+    py Benchmark.py --ffmpeg /usr/bin/ffmpeg --mediainfo /usr/bin/mediainfo --compare base.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARK_DIR), 'scripts'))
+
+import ImageUploader as ImageUploaderModule
+from FakeImageHosts import FakeImageHosts
+from ImageUploader import ImageUploader
+from ReleaseInfo import ReleaseInfo
+from ScreenshotGenerator import ScreenshotGenerator
+from Settings import Settings
+import SyntheticMedia
+
+UPLOAD_HOSTS = ('ptpimg', 'imgbb', 'hdbimg')
+# metrics where a larger value is a regression, with the minimal absolute change worth reporting
+COMPARED_METRICS = {'wall_secs': 0.05, 'subprocesses': 1, 'bytes_written': 64 * 1024, 'peak_rss_kb': 8 * 1024}
+
+
+class SubprocessCounter(subprocess.Popen):
+    """ Stand-in for subprocess.Popen that counts spawns; run() and check_output() go through Popen as well """
+    count = 0
+
+    def __init__(self, *args, **kwargs):
+        SubprocessCounter.count += 1
+        super().__init__(*args, **kwargs)
+
+
+def main():
+    args = _parse_args()
+    media_dir = os.path.abspath(args.media_dir)
+    print('Generating test media in ' + media_dir)
+    releases = SyntheticMedia.generate_all(args.ffmpeg, media_dir, args.duration)
+
+    results = {}
+    with FakeImageHosts(latency=args.host_latency) as hosts:
+        for scenario, release_path in releases.items():
+            if args.scenario and scenario not in args.scenario:
+                continue
+            print(f'Running {scenario}')
+            # a fresh process per scenario keeps peak RSS and child process statistics apart
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                results[scenario] = executor.submit(
+                    _run_scenario, args, release_path, hosts.get_endpoints()).result()
+
+    _print_results(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf8') as f:
+            json.dump(results, f, indent=4)
+        print('Baseline saved to ' + args.save_baseline)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf8') as f:
+            baseline = json.load(f)
+        if _compare(baseline, results, args.tolerance):
+            sys.exit(1)
+
+
+def _run_scenario(args, release_path, endpoints):
+    subprocess.Popen = SubprocessCounter
+    for name, value in endpoints.items():
+        setattr(ImageUploaderModule, name, value)
+
+    work_dir = tempfile.mkdtemp(prefix='rlsinfo-bench-')
+    image_save_location = os.path.join(work_dir, 'images')
+    os.makedirs(image_save_location)
+
+    # every scenario starts cold: empty caches and upload index
+    Settings.paths = {
+        'image_save_location': image_save_location,
+        'ffmpeg_bin_path': args.ffmpeg,
+        'mediainfo_bin_path': args.mediainfo
+    }
+    Settings.image_hosts = [{'name': name, 'username': 'bench', 'api_key': 'bench', 'default': False}
+                            for name in UPLOAD_HOSTS]
+    Settings.performance['cache_dir'] = os.path.join(work_dir, 'cache')
+
+    stages = {}
+    try:
+        rls = ReleaseInfo(release_path)
+        stages['probe'] = _measure(work_dir, rls.get_complete_mediainfo)
+
+        images = []
+        stages['screenshots'] = _measure(work_dir, lambda: images.extend(
+            ScreenshotGenerator().generate_screenshots(rls)))
+
+        for image_host_id, host_name in enumerate(UPLOAD_HOSTS):
+            uploader = ImageUploader(images, 'Benchmark', image_host_id=image_host_id)
+            stages['upload_' + host_name] = _measure(work_dir, uploader.upload)
+    except Exception as e:
+        stages['error'] = repr(e)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return stages
+
+
+def _measure(work_dir, fn):
+    """
+    :return: (dict) wall time, spawned subprocesses, bytes written below work_dir, and the peak RSS of this process
+             and of its largest child so far
+    """
+    sizes_before = _get_file_sizes(work_dir)
+    subprocesses_before = SubprocessCounter.count
+    start = time.perf_counter()
+
+    fn()
+
+    wall_secs = time.perf_counter() - start
+    sizes_after = _get_file_sizes(work_dir)
+    bytes_written = sum(max(0, size - sizes_before.get(path, 0)) for path, size in sizes_after.items())
+
+    return {
+        'wall_secs': round(wall_secs, 3),
+        'subprocesses': SubprocessCounter.count - subprocesses_before,
+        'bytes_written': bytes_written,
+        'peak_rss_kb': _to_kb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss),
+        'children_peak_rss_kb': _to_kb(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    }
+
+
+def _get_file_sizes(directory):
+    sizes = {}
+    for root, _, files in os.walk(directory):
+        for f in files:
+            try:
+                sizes[os.path.join(root, f)] = os.path.getsize(os.path.join(root, f))
+            except OSError:
+                continue
+    return sizes
+
+
+def _to_kb(max_rss):
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    return max_rss // 1024 if sys.platform == 'darwin' else max_rss
+
+
+def _print_results(results):
+    print('\n{:<16}{:<18}{:>10}{:>8}{:>14}{:>12}{:>14}'.format(
+        'scenario', 'stage', 'wall s', 'procs', 'bytes written', 'rss KB', 'child rss KB'))
+    for scenario, stages in results.items():
+        for stage, metrics in stages.items():
+            if stage == 'error':
+                print(f'{scenario:<16}error: {metrics}')
+                continue
+            print('{:<16}{:<18}{:>10.3f}{:>8}{:>14}{:>12}{:>14}'.format(
+                scenario, stage, metrics['wall_secs'], metrics['subprocesses'], metrics['bytes_written'],
+                metrics['peak_rss_kb'], metrics['children_peak_rss_kb']))
+
+
+def _compare(baseline, results, tolerance):
+    """
+    Prints every metric that grew by more than tolerance (relative) against the baseline
+    :return: (bool) True if there was a regression
+    """
+    regressions = []
+    for scenario, stages in results.items():
+        for stage, metrics in stages.items():
+            baseline_metrics = baseline.get(scenario, {}).get(stage)
+            if stage == 'error' or not isinstance(baseline_metrics, dict):
+                continue
+            for metric, min_change in COMPARED_METRICS.items():
+                old, new = baseline_metrics[metric], metrics[metric]
+                if new - old > max(min_change, old * tolerance):
+                    regressions.append(f'{scenario}/{stage} {metric}: {old} -> {new}')
+
+    print('\nRegressions against baseline:\n  ' + '\n  '.join(regressions) if regressions else
+          '\nNo regressions against baseline')
+    return bool(regressions)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description='Offline benchmark with synthetic media and local image hosts')
+    parser.add_argument('--ffmpeg', required=True, help='path of the ffmpeg binary')
+    parser.add_argument('--mediainfo', required=True, help='path of the mediainfo binary')
+    parser.add_argument('--media-dir', default=os.path.join(BENCHMARK_DIR, 'media'),
+                        help='where the generated test media is kept between runs')
+    parser.add_argument('--duration', type=int, default=120, help='length of the generated videos in seconds')
+    parser.add_argument('--scenario', action='append', choices=list(SyntheticMedia.SCENARIOS) +
+                        [SyntheticMedia.DVD_SCENARIO], help='only run this scenario (repeatable)')
+    parser.add_argument('--host-latency', type=float, default=0.0,
+                        help='seconds the fake image hosts wait before answering')
+    parser.add_argument('--save-baseline', metavar='FILE', help='save the results as a baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare the results against a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative growth of a metric that counts as a regression (default: 0.2)')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
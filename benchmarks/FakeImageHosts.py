@@ -0,0 +1,92 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeImageHosts:
+    """
+    Local HTTP server standing in for the ptpimg, imgbb and hdbimg upload endpoints. Responses have the same shape
+    as the real ones; request bodies are only counted
+    """
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.n_requests = 0
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def get_endpoints(self):
+        base_url = 'http://127.0.0.1:{}'.format(self._server.server_port)
+        return {
+            'ENDPOINT_PTPIMG': base_url + '/ptpimg/upload.php',
+            'ENDPOINT_IMGBB': base_url + '/imgbb/1/upload',
+            'ENDPOINT_HDBIMG': base_url + '/hdbimg/upload_api.php',
+        }
+
+    def _record(self, n_bytes):
+        with self._lock:
+            self.n_requests += 1
+            self.bytes_received += n_bytes
+            return self.n_requests
+
+    def _make_handler(self):
+        hosts = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self._read_body()
+                request_num = hosts._record(len(body))
+                time.sleep(hosts.latency)
+
+                if self.path.startswith('/ptpimg/'):
+                    n_files = max(1, body.count(b'name="file-upload['))
+                    resp = json.dumps([{'code': f'bench{request_num}x{i}', 'ext': 'png'} for i in range(n_files)])
+                elif self.path.startswith('/imgbb/'):
+                    url = f'https://i.ibb.co/bench{request_num}/image.png'
+                    resp = json.dumps({'data': {'image': {'url': url}, 'medium': {'url': url}}})
+                elif self.path.startswith('/hdbimg/'):
+                    n_files = max(1, body.count(b'name="images_files['))
+                    resp = ''.join(f'[url=https://img.hdbits.org/bench{request_num}x{i}]'
+                                   f'[img]https://t.hdbits.org/bench{request_num}x{i}.jpg[/img][/url]'
+                                   for i in range(n_files))
+                else:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                resp = resp.encode()
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(resp)))
+                self.end_headers()
+                self.wfile.write(resp)
+
+            def _read_body(self):
+                if self.headers.get('Transfer-Encoding', '').lower() != 'chunked':
+                    return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+                body = bytearray()
+                while True:
+                    chunk_size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                    if chunk_size == 0:
+                        self.rfile.readline()
+                        return bytes(body)
+                    body += self.rfile.read(chunk_size)
+                    self.rfile.readline()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,69 @@
+#!python3
+"""
+Import-time budget check for the entry points. Every module is imported in a fresh interpreter; the check fails if
+the fastest of several imports exceeds the budget, or if importing it pulls in a module that only later stages
+need (numpy, PIL, requests, guessit, pyperclip).
+
+    py ImportTime.py [--budget-ms 150] [--runs 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), 'scripts')
+
+ENTRY_MODULES = ('ReleaseInfoCreator', 'BatchScheduler', 'WatchDaemon')
+# only imported by the stages that use them
+DEFERRED_MODULES = ('numpy', 'PIL', 'requests', 'guessit', 'pyperclip')
+
+CHILD_CODE = '''
+import json, sys, time
+sys.path.insert(0, {scripts_dir!r})
+start = time.perf_counter()
+import {module}
+elapsed_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({{'elapsed_ms': elapsed_ms, 'loaded': [m for m in {deferred!r} if m in sys.modules]}}))
+'''
+
+
+def main():
+    args = _parse_args()
+    failed = False
+
+    print('{:<20} {:>10}  {}'.format('module', 'import_ms', 'deferred modules loaded'))
+    for module in args.module or ENTRY_MODULES:
+        results = [_import_in_child(module) for _ in range(max(1, args.runs))]
+        elapsed_ms = min(result['elapsed_ms'] for result in results)
+        loaded = sorted(set(m for result in results for m in result['loaded']))
+
+        over_budget = elapsed_ms > args.budget_ms
+        failed = failed or over_budget or bool(loaded)
+        print('{:<20} {:>10.1f}  {}{}'.format(module, elapsed_ms, ', '.join(loaded) or '-',
+                                              '  OVER BUDGET' if over_budget else ''))
+
+    if failed:
+        print(f'\nImport-time check failed (budget: {args.budget_ms} ms, deferred: {", ".join(DEFERRED_MODULES)})')
+        sys.exit(1)
+
+
+def _import_in_child(module):
+    code = CHILD_CODE.format(scripts_dir=SCRIPTS_DIR, module=module, deferred=DEFERRED_MODULES)
+    output = subprocess.check_output([sys.executable, '-c', code])
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description='Import-time budget check for the entry points')
+    parser.add_argument('--budget-ms', type=float, default=150.0,
+                        help='largest acceptable import time of a module, in ms (default: 150)')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='imports per module; the fastest one is compared to the budget (default: 5)')
+    parser.add_argument('--module', action='append', help='only check this module (repeatable)')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
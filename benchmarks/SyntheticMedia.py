@@ -0,0 +1,85 @@
+import os
+import struct
+import subprocess
+
+# name: (container extension, width, height, sample aspect ratio)
+SCENARIOS = {
+    'sd_anamorphic': ('mkv', 720, 480, '32/27'),
+    'hd': ('mkv', 1920, 1080, '1/1'),
+    'uhd': ('mp4', 3840, 2160, '1/1'),
+}
+DVD_SCENARIO = 'dvd'
+DVD_VOB_COUNT = 2
+
+
+def generate_all(ffmpeg_bin_path, work_dir, duration):
+    """
+    Generates every benchmark release with ffmpeg's lavfi sources. Encodes are bit-exact, so the same ffmpeg
+    build always produces the same files; existing files are reused
+    :return: (dict) scenario name -> release path (str)
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    releases = {}
+
+    for name, (ext, width, height, sar) in SCENARIOS.items():
+        path = os.path.join(work_dir, f'{name}.{ext}')
+        if not os.path.isfile(path):
+            _run_ffmpeg(ffmpeg_bin_path, f'-f lavfi -i testsrc2=size={width}x{height}:rate=24:duration={duration} '
+                                         f'-vf setsar={sar} -c:v libx264 -preset ultrafast -g 48 "{path}"')
+        releases[name] = path
+
+    releases[DVD_SCENARIO] = _generate_dvd(ffmpeg_bin_path, os.path.join(work_dir, DVD_SCENARIO), duration)
+    return releases
+
+
+def _generate_dvd(ffmpeg_bin_path, release_path, duration):
+    """
+    Fake DVD release: a VIDEO_TS folder with equally sized main movie VOBs, a VMG IFO and one VTS IFO whose
+    program chain lasts as long as all VOBs together
+    """
+    video_ts_path = os.path.join(release_path, 'VIDEO_TS')
+    os.makedirs(video_ts_path, exist_ok=True)
+    vob_duration = max(1, duration // DVD_VOB_COUNT)
+
+    for i in range(DVD_VOB_COUNT):
+        path = os.path.join(video_ts_path, f'VTS_01_{i + 1}.VOB')
+        if not os.path.isfile(path):
+            _run_ffmpeg(ffmpeg_bin_path, f'-f lavfi -i testsrc2=size=720x480:rate=30000/1001:duration={vob_duration} '
+                                         f'-target ntsc-dvd -aspect 16:9 -an "{path}"')
+
+    with open(os.path.join(video_ts_path, 'VIDEO_TS.IFO'), 'wb') as f:
+        f.write(b'DVDVIDEO-VMG'.ljust(2048, b'\0'))
+    with open(os.path.join(video_ts_path, 'VTS_01_0.IFO'), 'wb') as f:
+        f.write(_build_vts_ifo(vob_duration * DVD_VOB_COUNT))
+
+    return release_path
+
+
+def _build_vts_ifo(duration):
+    """
+    Minimal VTS IFO: header with the VTS_PGCI sector pointer and video attributes (MPEG-2, NTSC, 16:9, 720x480),
+    and a program chain table holding a single PGC with the given BCD playback time at 29.97 fps
+    """
+    def bcd(value):
+        return ((value // 10) << 4) | (value % 10)
+
+    header = bytearray(2048)
+    header[0:12] = b'DVDVIDEO-VTS'
+    struct.pack_into('>I', header, 0xCC, 1)
+    header[0x200:0x202] = bytes([0b01001100, 0b00000000])
+
+    pgc = bytearray(0xEC)
+    hours, rest = divmod(int(duration), 3600)
+    minutes, seconds = divmod(rest, 60)
+    pgc[4:8] = bytes([bcd(hours), bcd(minutes), bcd(seconds), 0b11000000])
+
+    pgci = bytearray(8 + 8)
+    struct.pack_into('>HHI', pgci, 0, 1, 0, len(pgci) + len(pgc) - 1)
+    struct.pack_into('>II', pgci, 8, 0x81000000, len(pgci))
+
+    return bytes(header) + (pgci + pgc).ljust(2048, b'\0')
+
+
+def _run_ffmpeg(ffmpeg_bin_path, args):
+    subprocess.run(f'"{ffmpeg_bin_path}" -hide_banner -loglevel error -y -fflags +bitexact -flags:v +bitexact {args}',
+                   shell=True, check=True)
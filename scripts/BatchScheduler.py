@@ -0,0 +1,132 @@
+import hashlib
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from ReleaseInfo import VIDEO_FILE_TYPES
+from ReleaseProcessor import ReleaseProcessor
+from Settings import Settings
+
+
+class BatchScheduler:
+    """
+    Runs many releases through probe -> screenshots -> upload. Every stage has its own worker pool, so while one
+    release is uploading, the next one is already being probed or run through ffmpeg. Results are written to one
+    text file per release instead of the clipboard
+    """
+    def __init__(self, input_paths, image_host_id, output_dir='', contact_sheet=False, pack_mode='',
+                 settings=Settings, expand_input_paths=True):
+        """
+        :param settings: Settings, or a Config
+        :param expand_input_paths: (bool) False if input_paths are releases already, e.g. from _expand_input_paths();
+                                   they are then processed as they are, and run() returns failures among them
+        """
+        if expand_input_paths:
+            self.release_paths = self._expand_input_paths(input_paths, pack_mode)
+        else:
+            self.release_paths = [os.path.abspath(input_path) for input_path in input_paths]
+        self.release_names = self._get_release_names(self.release_paths)
+        self.settings = settings
+        self.processor = ReleaseProcessor(settings, image_host_id, contact_sheet=contact_sheet, pack_mode=pack_mode)
+        self.output_dir = output_dir or settings.performance['batch_output_dir'] or \
+            settings.paths['image_save_location']
+        self.output_dir = os.path.expanduser(self.output_dir)
+
+        self._probe_executor = None
+        self._extract_executor = None
+        self._upload_executor = None
+
+    def run(self):
+        """
+        :return: (list) of release paths that failed
+        """
+        n_probe_workers = max(1, self.settings.performance['batch_probe_workers'])
+        n_extract_workers = max(1, self.settings.performance['batch_extract_workers'])
+        n_upload_workers = max(1, self.settings.performance['batch_upload_workers'])
+
+        with ThreadPoolExecutor(max_workers=n_probe_workers) as self._probe_executor, \
+                ThreadPoolExecutor(max_workers=n_extract_workers) as self._extract_executor, \
+                ThreadPoolExecutor(max_workers=n_upload_workers) as self._upload_executor, \
+                ThreadPoolExecutor(max_workers=n_probe_workers + n_extract_workers + n_upload_workers) as drivers:
+            # a driver only waits on the stage pools; enough of them keep every stage busy
+            results = list(drivers.map(self._process_release, self.release_paths))
+
+        return [path for path, ok in zip(self.release_paths, results) if not ok]
+
+    def _process_release(self, input_path):
+        try:
+            # a release that failed in an earlier run resumes at its first stage that did not complete
+            journal = self.processor.get_journal(input_path)
+            rls = self._probe_executor.submit(self.processor.probe, input_path, journal).result()
+            # the same content may have been uploaded before under another path
+            uploaded = self.processor.get_uploaded(rls, journal)
+            if uploaded is None:
+                # screenshots of releases extracted at the same time go to the same folder
+                name_prefix = self.release_names[input_path] + ' '
+                images, image_sources = self._extract_executor.submit(self.processor.take_screenshots, rls, journal,
+                                                                      name_prefix).result()
+                uploaded = self._upload_executor.submit(self.processor.upload, rls, images, image_sources,
+                                                        journal).result()
+
+            # an output directory that can't be written to fails the releases, not the batch
+            os.makedirs(self.output_dir, exist_ok=True)
+            output_filepath = os.path.join(self.output_dir, self.release_names[input_path] + '.txt')
+            release_info = rls.get_report(uploaded['image_urls'], uploaded['image_url_lines'],
+                                          uploaded['image_sources'])
+            # a crash while writing must not leave a result file that looks complete
+            temp_filepath = output_filepath + '.tmp'
+            with open(temp_filepath, 'w', encoding='utf8') as f:
+                f.write(release_info)
+            os.replace(temp_filepath, output_filepath)
+            journal.finish()
+        except Exception:
+            print(f'Failed: {input_path}\n{traceback.format_exc()}')
+            return False
+
+        print(f'Done: {input_path} -> {output_filepath}')
+        return True
+
+    @staticmethod
+    def _get_release_names(release_paths):
+        """
+        :param release_paths: (list) of absolute release paths (str)
+        :return: (dict) release path -> name for its result file and screenshots: the base name, followed by a
+                 short hash of the full path if other releases of the batch have the same base name
+        """
+        base_names = [os.path.basename(path) for path in release_paths]
+        release_names = {}
+        for path, base_name in zip(release_paths, base_names):
+            if base_names.count(base_name) > 1:
+                base_name += ' [{}]'.format(hashlib.sha1(path.encode()).hexdigest()[:8])
+            release_names[path] = base_name
+        return release_names
+
+    @staticmethod
+    def _expand_input_paths(input_paths, pack_mode=''):
+        """
+        Video files and DVD folders are releases themselves, and so are folders holding video files in pack mode;
+        any other folder is treated as a directory of releases (video files, DVD folders or folders holding video
+        files)
+        :param input_paths: (list) of paths (str)
+        :return: (list) of absolute release paths (str)
+        """
+        release_paths = []
+        for input_path in input_paths:
+            input_path = os.path.abspath(input_path)
+            if os.path.isfile(input_path) or os.path.isdir(os.path.join(input_path, 'VIDEO_TS')) or \
+                    (pack_mode and os.path.isdir(input_path) and
+                     any(f.endswith(VIDEO_FILE_TYPES) for f in os.listdir(input_path))):
+                release_paths.append(input_path)
+            elif os.path.isdir(input_path):
+                release_paths.extend(os.path.join(input_path, f) for f in sorted(os.listdir(input_path))
+                                     if BatchScheduler._is_release(os.path.join(input_path, f)))
+        return release_paths
+
+    @staticmethod
+    def _is_release(path):
+        if os.path.isfile(path):
+            return path.endswith(VIDEO_FILE_TYPES)
+        if not os.path.isdir(path):
+            return False
+        return os.path.isdir(os.path.join(path, 'VIDEO_TS')) or \
+            any(f.endswith(VIDEO_FILE_TYPES) for f in os.listdir(path))
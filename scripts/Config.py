@@ -0,0 +1,95 @@
+import json
+import os
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Tuple
+
+from Settings import Settings, PERFORMANCE_DEFAULTS
+
+
+class Config(NamedTuple):
+    """
+    Immutable counterpart of Settings for library use. It has the same attributes, so it can be passed as the
+    settings= argument of every class that takes one, and releases with different configs can run side by side in
+    one process. Never prompts; values missing from a settings file take their defaults
+    """
+    paths: Mapping
+    image_hosts: Tuple[Mapping, ...] = ()
+    print_not_copy: bool = False
+    use_bbcode_tags: bool = False
+    performance: Mapping = MappingProxyType(dict(PERFORMANCE_DEFAULTS))
+
+    @staticmethod
+    def create(paths, image_hosts=(), print_not_copy=False, use_bbcode_tags=False, performance=None):
+        """
+        :param paths: (dict) 'image_save_location', 'ffmpeg_bin_path', 'mediainfo_bin_path' and optionally
+                      'ffprobe_bin_path'
+        :param image_hosts: (list) of dicts as in the settings file, e.g. {'name': 'ptpimg', 'api_key': '...'}
+        :param performance: (dict) overrides of PERFORMANCE_DEFAULTS
+        :return: Config
+        """
+        unknown_keys = set(performance or {}) - set(PERFORMANCE_DEFAULTS)
+        assert not unknown_keys, 'Error: Unknown performance settings: ' + ', '.join(sorted(unknown_keys))
+
+        return Config(
+            paths=Config._freeze({name: os.path.expanduser(path) for name, path in paths.items()}),
+            image_hosts=tuple(Config._freeze({'default': False, **image_host}) for image_host in image_hosts),
+            print_not_copy=bool(print_not_copy),
+            use_bbcode_tags=bool(use_bbcode_tags),
+            performance=Config._freeze({**PERFORMANCE_DEFAULTS, **(performance or {})})
+        )
+
+    @staticmethod
+    def from_file(filepath=Settings.settings_file_path):
+        """
+        :param filepath: (str) settings file as written by Settings
+        :return: Config
+        """
+        with open(filepath, 'r', encoding='utf8') as f:
+            settings_from_file = json.load(f)
+
+        # settings the file doesn't have yet are not asked for
+        performance = {key: value for key, value in settings_from_file.get('performance', {}).items()
+                       if key in PERFORMANCE_DEFAULTS}
+        return Config.create(settings_from_file['paths'], settings_from_file.get('image_hosts', ()),
+                             print_not_copy=settings_from_file.get('print_not_copy') or False,
+                             use_bbcode_tags=settings_from_file.get('use_bbcode_tags') or False,
+                             performance=performance)
+
+    @staticmethod
+    def from_settings():
+        """
+        :return: Config snapshot of the current Settings, e.g. after Settings.load_settings()
+        """
+        return Config.create(Settings.paths, Settings.image_hosts, Settings.print_not_copy, Settings.use_bbcode_tags,
+                             Settings.performance)
+
+    def with_performance(self, **performance):
+        """
+        :return: Config with some performance settings replaced
+        """
+        return Config.create(self.paths, self.image_hosts, self.print_not_copy, self.use_bbcode_tags,
+                             {**self.performance, **performance})
+
+    def get_image_host_id(self, host_name=None):
+        """
+        Non-interactive counterpart of Settings.get_preferred_host()
+        :param host_name: (str) e.g. 'ptpimg'; defaults to the host marked as default, or else the first host with
+                          an API key
+        :return: (int) index into image_hosts
+        """
+        configured_ids = [i for i, image_host in enumerate(self.image_hosts)
+                          if image_host.get('api_key', '').strip() != '']
+        if host_name is not None:
+            host_ids = [i for i in configured_ids if self.image_hosts[i]['name'] == host_name]
+        else:
+            host_ids = [i for i in configured_ids if self.image_hosts[i]['default']] or configured_ids
+        assert host_ids, 'Error: No image host has been set up' + (f' with the name {host_name}' if host_name else '')
+        return host_ids[0]
+
+    @staticmethod
+    def _freeze(value):
+        if isinstance(value, Mapping):
+            return MappingProxyType({key: Config._freeze(item) for key, item in value.items()})
+        if isinstance(value, (list, tuple)):
+            return tuple(Config._freeze(item) for item in value)
+        return value
@@ -0,0 +1,322 @@
+import mmap
+import struct
+
+# Matroska element IDs (marker bits included)
+EBML_HEADER = 0x1A45DFA3
+MKV_SEGMENT = 0x18538067
+MKV_SEEK_HEAD = 0x114D9B74
+MKV_SEEK = 0x4DBB
+MKV_SEEK_ID = 0x53AB
+MKV_SEEK_POSITION = 0x53AC
+MKV_INFO = 0x1549A966
+MKV_TIMESTAMP_SCALE = 0x2AD7B1
+MKV_DURATION = 0x4489
+MKV_TRACKS = 0x1654AE6B
+MKV_TRACK_ENTRY = 0xAE
+MKV_TRACK_TYPE = 0x83
+MKV_VIDEO = 0xE0
+MKV_PIXEL_WIDTH = 0xB0
+MKV_PIXEL_HEIGHT = 0xBA
+MKV_DISPLAY_WIDTH = 0x54B0
+MKV_DISPLAY_HEIGHT = 0x54BA
+MKV_DISPLAY_UNIT = 0x54B2
+MKV_CLUSTER = 0x1F43B675
+MKV_TRACK_TYPE_VIDEO = 1
+# DisplayWidth/DisplayHeight units that express an aspect ratio (pixels, display aspect ratio)
+MKV_ASPECT_DISPLAY_UNITS = (0, 3)
+
+# MP4 boxes whose children are searched
+MP4_CONTAINER_BOXES = (b'moov', b'trak', b'mdia', b'minf', b'stbl')
+# size of the VisualSampleEntry fields between the box header and its child boxes
+MP4_VISUAL_SAMPLE_ENTRY_SIZE = 8 + 70
+# offset of the 16.16 fixed-point width and height in a tkhd box, per box version
+MP4_TKHD_SIZE_OFFSETS = {0: 76, 1: 88}
+
+
+class ContainerProbe:
+    """
+    Reads duration, dimensions and aspect ratios straight from the headers of MKV (EBML header, Info and Tracks
+    elements) and MP4 files (mvhd, tkhd, stsd and pasp boxes). Files are memory-mapped and only the header
+    elements are touched, a few KB even for multi-GB files. Results have the shape of mediainfo's JSON output
+    """
+    @staticmethod
+    def read(file):
+        """
+        :param file: file path (str)
+        :return: (dict) mediainfo-style JSON, or None for other containers or anything that can't be parsed
+        """
+        try:
+            with open(file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data[:4] == struct.pack('>I', EBML_HEADER):
+                    return ContainerProbe._read_mkv(data)
+                if data[4:8] == b'ftyp':
+                    return ContainerProbe._read_mp4(data)
+        except (OSError, ValueError, IndexError, struct.error):
+            return None
+        return None
+
+    @staticmethod
+    def _to_mediainfo_json(duration, width, height, display_aspect_ratio):
+        if not duration or not width or not height or not display_aspect_ratio:
+            return None
+        return {'media': {'track': [
+            {'@type': 'General', 'Duration': '{:.3f}'.format(duration)},
+            {
+                '@type': 'Video',
+                'Width': str(width),
+                'Height': str(height),
+                'PixelAspectRatio': '{:.3f}'.format(display_aspect_ratio / (width / height)),
+                'DisplayAspectRatio': '{:.3f}'.format(display_aspect_ratio)
+            }
+        ]}}
+
+    # --- Matroska ---
+
+    @staticmethod
+    def _read_mkv(data):
+        _, pos = ContainerProbe._read_ebml_element(data, 0)
+        segment_id, segment_size, segment_start = ContainerProbe._read_ebml_header(data, pos)
+        if segment_id != MKV_SEGMENT:
+            return None
+        segment_end = len(data) if segment_size is None else min(len(data), segment_start + segment_size)
+
+        # top-level elements up to the first cluster; Info and Tracks usually come first, otherwise the SeekHead
+        # says where they are
+        elements = {}
+        seek_positions = {}
+        pos = segment_start
+        while pos < segment_end:
+            element_id, size, data_start = ContainerProbe._read_ebml_header(data, pos)
+            if element_id == MKV_CLUSTER or size is None:
+                break
+            if element_id in (MKV_INFO, MKV_TRACKS):
+                elements[element_id] = (data_start, data_start + size)
+            elif element_id == MKV_SEEK_HEAD:
+                seek_positions.update(ContainerProbe._read_mkv_seek_head(data, data_start, data_start + size))
+            pos = data_start + size
+
+        for element_id in (MKV_INFO, MKV_TRACKS):
+            if element_id not in elements and element_id in seek_positions:
+                found_id, size, data_start = ContainerProbe._read_ebml_header(
+                    data, segment_start + seek_positions[element_id])
+                if found_id == element_id and size is not None:
+                    elements[element_id] = (data_start, data_start + size)
+        if MKV_INFO not in elements or MKV_TRACKS not in elements:
+            return None
+
+        duration = ContainerProbe._read_mkv_duration(data, *elements[MKV_INFO])
+        video = ContainerProbe._read_mkv_video(data, *elements[MKV_TRACKS])
+        if video is None:
+            return None
+        return ContainerProbe._to_mediainfo_json(duration, *video)
+
+    @staticmethod
+    def _read_mkv_seek_head(data, start, end):
+        seek_positions = {}
+        for element_id, seek_start, seek_end in ContainerProbe._iter_ebml_children(data, start, end):
+            if element_id != MKV_SEEK:
+                continue
+            children = ContainerProbe._get_ebml_children(data, seek_start, seek_end)
+            if MKV_SEEK_ID in children and MKV_SEEK_POSITION in children:
+                seek_id = ContainerProbe._read_uint(data, *children[MKV_SEEK_ID])
+                seek_positions[seek_id] = ContainerProbe._read_uint(data, *children[MKV_SEEK_POSITION])
+        return seek_positions
+
+    @staticmethod
+    def _read_mkv_duration(data, start, end):
+        children = ContainerProbe._get_ebml_children(data, start, end)
+        if MKV_DURATION not in children:
+            return None
+        timestamp_scale = 1000000
+        if MKV_TIMESTAMP_SCALE in children:
+            timestamp_scale = ContainerProbe._read_uint(data, *children[MKV_TIMESTAMP_SCALE])
+
+        duration_start, duration_end = children[MKV_DURATION]
+        float_format = '>f' if duration_end - duration_start == 4 else '>d'
+        return struct.unpack_from(float_format, data, duration_start)[0] * timestamp_scale / 1e9
+
+    @staticmethod
+    def _read_mkv_video(data, start, end):
+        """
+        :return: (tuple) width, height and display aspect ratio of the first video track, or None
+        """
+        for element_id, entry_start, entry_end in ContainerProbe._iter_ebml_children(data, start, end):
+            if element_id != MKV_TRACK_ENTRY:
+                continue
+            entry = ContainerProbe._get_ebml_children(data, entry_start, entry_end)
+            if MKV_TRACK_TYPE not in entry or MKV_VIDEO not in entry or \
+                    ContainerProbe._read_uint(data, *entry[MKV_TRACK_TYPE]) != MKV_TRACK_TYPE_VIDEO:
+                continue
+
+            video = ContainerProbe._get_ebml_children(data, *entry[MKV_VIDEO])
+            width = ContainerProbe._read_uint(data, *video[MKV_PIXEL_WIDTH])
+            height = ContainerProbe._read_uint(data, *video[MKV_PIXEL_HEIGHT])
+
+            display_aspect_ratio = width / height
+            display_unit = ContainerProbe._read_uint(data, *video[MKV_DISPLAY_UNIT]) \
+                if MKV_DISPLAY_UNIT in video else 0
+            if MKV_DISPLAY_WIDTH in video and MKV_DISPLAY_HEIGHT in video and \
+                    display_unit in MKV_ASPECT_DISPLAY_UNITS:
+                display_height = ContainerProbe._read_uint(data, *video[MKV_DISPLAY_HEIGHT])
+                if display_height:
+                    display_aspect_ratio = ContainerProbe._read_uint(data, *video[MKV_DISPLAY_WIDTH]) / display_height
+            return width, height, display_aspect_ratio
+        return None
+
+    @staticmethod
+    def _get_ebml_children(data, start, end):
+        """
+        :return: (dict) element id -> (data start, data end) of the first child with that id
+        """
+        children = {}
+        for element_id, child_start, child_end in ContainerProbe._iter_ebml_children(data, start, end):
+            children.setdefault(element_id, (child_start, child_end))
+        return children
+
+    @staticmethod
+    def _iter_ebml_children(data, start, end):
+        pos = start
+        while pos < end:
+            element_id, size, data_start = ContainerProbe._read_ebml_header(data, pos)
+            if size is None:
+                raise ValueError('Unknown-size element inside a master element')
+            yield element_id, data_start, data_start + size
+            pos = data_start + size
+
+    @staticmethod
+    def _read_ebml_element(data, pos):
+        _, size, data_start = ContainerProbe._read_ebml_header(data, pos)
+        return (data_start, data_start + size), data_start + size
+
+    @staticmethod
+    def _read_ebml_header(data, pos):
+        """
+        :return: (tuple) element id, data size (None if unknown) and position of the element data
+        """
+        element_id, pos, _ = ContainerProbe._read_vint(data, pos, keep_marker=True)
+        size, pos, is_unknown = ContainerProbe._read_vint(data, pos, keep_marker=False)
+        return element_id, None if is_unknown else size, pos
+
+    @staticmethod
+    def _read_vint(data, pos, keep_marker):
+        first = data[pos]
+        length = 1
+        mask = 0x80
+        while length <= 8 and not first & mask:
+            mask >>= 1
+            length += 1
+        if length > 8:
+            raise ValueError('Invalid EBML variable-size integer')
+
+        value = first if keep_marker else first & (mask - 1)
+        for byte in data[pos + 1:pos + length]:
+            value = (value << 8) | byte
+        is_unknown = not keep_marker and value == (1 << (7 * length)) - 1
+        return value, pos + length, is_unknown
+
+    @staticmethod
+    def _read_uint(data, start, end):
+        return int.from_bytes(data[start:end], 'big')
+
+    # --- MP4 ---
+
+    @staticmethod
+    def _read_mp4(data):
+        moov = ContainerProbe._find_mp4_boxes(data, 0, len(data), b'moov')
+        if not moov:
+            return None
+        moov_start, moov_end = moov[0]
+
+        duration = ContainerProbe._read_mp4_duration(data, moov_start, moov_end)
+        for trak_start, trak_end in ContainerProbe._find_mp4_boxes(data, moov_start, moov_end, b'trak'):
+            video = ContainerProbe._read_mp4_video(data, trak_start, trak_end)
+            if video is not None:
+                return ContainerProbe._to_mediainfo_json(duration, *video)
+        return None
+
+    @staticmethod
+    def _read_mp4_duration(data, start, end):
+        mvhd = ContainerProbe._find_mp4_boxes(data, start, end, b'mvhd')
+        if not mvhd:
+            return None
+        pos = mvhd[0][0]
+        if data[pos] == 1:
+            timescale, duration = struct.unpack_from('>IQ', data, pos + 4 + 16)
+        else:
+            timescale, duration = struct.unpack_from('>II', data, pos + 4 + 8)
+        return duration / timescale if timescale else None
+
+    @staticmethod
+    def _read_mp4_video(data, start, end):
+        """
+        :return: (tuple) width, height and display aspect ratio if the trak is a video track, else None
+        """
+        hdlr = ContainerProbe._find_mp4_boxes(data, start, end, b'mdia', b'hdlr')
+        if not hdlr or data[hdlr[0][0] + 8:hdlr[0][0] + 12] != b'vide':
+            return None
+
+        stsd = ContainerProbe._find_mp4_boxes(data, start, end, b'mdia', b'minf', b'stbl', b'stsd')
+        if not stsd:
+            return None
+        # full box header and entry count, then the first sample entry
+        entry_start = stsd[0][0] + 8
+        entry_size = struct.unpack_from('>I', data, entry_start)[0]
+        width, height = struct.unpack_from('>HH', data, entry_start + 8 + 24)
+        if not width or not height:
+            return None
+
+        children_start = entry_start + 8 + MP4_VISUAL_SAMPLE_ENTRY_SIZE
+        pasp = ContainerProbe._find_mp4_boxes(data, children_start, entry_start + entry_size, b'pasp')
+        if pasp:
+            h_spacing, v_spacing = struct.unpack_from('>II', data, pasp[0][0])
+            if h_spacing and v_spacing:
+                return width, height, width * h_spacing / (height * v_spacing)
+
+        # without pasp, the presentation size in the track header gives the display aspect ratio
+        tkhd_size = ContainerProbe._read_mp4_tkhd_size(data, start, end)
+        if tkhd_size is not None:
+            return width, height, tkhd_size[0] / tkhd_size[1]
+        return width, height, width / height
+
+    @staticmethod
+    def _read_mp4_tkhd_size(data, start, end):
+        """
+        :return: (tuple) display width and height (float) from the tkhd box of a trak, or None if it has none
+        """
+        tkhd = ContainerProbe._find_mp4_boxes(data, start, end, b'tkhd')
+        if not tkhd or data[tkhd[0][0]] not in MP4_TKHD_SIZE_OFFSETS:
+            return None
+        size_start = tkhd[0][0] + MP4_TKHD_SIZE_OFFSETS[data[tkhd[0][0]]]
+        if size_start + 8 > tkhd[0][1]:
+            return None
+        display_width, display_height = struct.unpack_from('>II', data, size_start)
+        if not display_width or not display_height:
+            return None
+        return display_width / 65536, display_height / 65536
+
+    @staticmethod
+    def _find_mp4_boxes(data, start, end, *path):
+        """
+        :param path: box types, each one a child of the previous
+        :return: (list) of (data start, data end) of every box matching the full path
+        """
+        matches = []
+        pos = start
+        while pos + 8 <= end:
+            size, box_type = struct.unpack_from('>I4s', data, pos)
+            header_size = 8
+            if size == 1:
+                size = struct.unpack_from('>Q', data, pos + 8)[0]
+                header_size = 16
+            elif size == 0:
+                size = end - pos
+            if size < header_size:
+                raise ValueError('Invalid MP4 box size')
+
+            if box_type == path[0]:
+                if len(path) == 1:
+                    matches.append((pos + header_size, pos + size))
+                elif box_type in MP4_CONTAINER_BOXES:
+                    matches.extend(ContainerProbe._find_mp4_boxes(data, pos + header_size, pos + size, *path[1:]))
+            pos += size
+        return matches
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import Helper
+from Settings import Settings
+
+# share of max_bytes that eviction frees the cache down to, so the next full scan is a while of puts away
+EVICT_TARGET = 0.9
+
+
+class DiskCache:
+    """
+    Size-bounded key/value store on disk. Every entry is a single file named after the hash of its key; once the
+    cache grows past max_bytes the least recently used entries (oldest mtime, refreshed on every hit) are evicted
+    """
+    # (cache directory) -> DiskCache, see get_shared()
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, namespace, max_bytes, settings=Settings):
+        """
+        :param settings: Settings, or a Config; decides the cache directory
+        """
+        self.cache_dir = os.path.join(Helper.get_cache_dir(settings), namespace)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # size of the entries, counted on by every put(); None until the first scan of the directory
+        self._size = None
+
+    @staticmethod
+    def get_shared(namespace, max_bytes, settings=Settings):
+        """
+        :return: DiskCache shared by every thread that uses the same cache directory, so they also share its
+                 eviction lock
+        """
+        cache_dir = os.path.join(Helper.get_cache_dir(settings), namespace)
+        with DiskCache._shared_lock:
+            if cache_dir not in DiskCache._shared:
+                DiskCache._shared[cache_dir] = DiskCache(namespace, max_bytes, settings)
+            return DiskCache._shared[cache_dir]
+
+    def get(self, key):
+        entry_path = self._get_entry_path(key)
+        try:
+            with open(entry_path, 'rb') as f:
+                value = f.read()
+            os.utime(entry_path)
+        except OSError:
+            return None
+        return value
+
+    def put(self, key, value):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # write to a temporary file first so concurrent readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(value)
+
+        entry_path = self._get_entry_path(key)
+        with self._lock:
+            try:
+                old_size = os.path.getsize(entry_path)
+            except OSError:
+                old_size = 0
+            os.replace(temp_path, entry_path)
+            if self._size is not None:
+                self._size += len(value) - old_size
+            # the directory is only scanned once the count passes the limit; other processes writing to the same
+            # directory are caught up with then
+            if self._size is None or self._size > self.max_bytes:
+                self._evict()
+
+    def get_json(self, key):
+        value = self.get(key)
+        return None if value is None else json.loads(value.decode())
+
+    def put_json(self, key, value):
+        self.put(key, json.dumps(value).encode())
+
+    def _get_entry_path(self, key):
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest())
+
+    def _evict(self):
+        """
+        Counts the entries on disk and, if they are over max_bytes, removes the least recently used ones until they
+        are down to EVICT_TARGET of it. Called with self._lock held
+        """
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            # files of puts still being written
+            if entry.name.endswith('.tmp'):
+                continue
+            try:
+                if entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            except FileNotFoundError:
+                # removed by another process since the directory was listed
+                continue
+        self._size = sum(size for _, size, _ in entries)
+        if self._size <= self.max_bytes:
+            return
+
+        for _, size, path in sorted(entries):
+            if self._size <= self.max_bytes * EVICT_TARGET:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            self._size -= size
@@ -1,8 +1,9 @@
-import json
 import os
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 import Helper
+from IfoReader import IfoReader
+from MediaProbe import MediaProbe
 from Settings import Settings
 
 VOB_EXTS = ('.vob', '.VOB')
@@ -10,30 +11,37 @@ IFO_EXTS = ('.ifo', '.IFO')
 
 
 class DvdAnalyzer:
-    def __init__(self, input_path):
+    def __init__(self, input_path, settings=Settings):
+        """
+        :param settings: Settings, or a Config
+        """
         self.video_ts_folder_path = os.path.join(input_path, 'VIDEO_TS')
+        self.settings = settings
 
     def get_primary_ifo_info(self):
         """
         Gathers mediainfo on all ifo files. Returns ifo file with longest runtime,
-        which indicates the total runtime of movie
+        which indicates the total runtime of movie. IFO headers are read natively; only files the reader
+        can't parse are probed with mediainfo, in parallel
         :return: file path (str)
         """
         ifo_files = [os.path.join(self.video_ts_folder_path, f)
                      for f in os.listdir(self.video_ts_folder_path) if f.endswith(IFO_EXTS)]
 
+        ifo_infos = {ifo_file: IfoReader.read(ifo_file) for ifo_file in ifo_files}
+        unparsed_ifo_files = [ifo_file for ifo_file, info in ifo_infos.items() if info is None]
+        if unparsed_ifo_files:
+            with ThreadPoolExecutor(max_workers=max(1, self.settings.performance['probe_workers'])) as executor:
+                ifo_infos.update(zip(unparsed_ifo_files, executor.map(
+                    lambda ifo_file: MediaProbe.get_json(ifo_file, self.settings), unparsed_ifo_files)))
+
         # Preliminary choosing.
         primary_ifo_file = ifo_files[0]
         primary_mediainfo_json = {}
         longest_duration = 0
 
         for ifo_file in ifo_files:
-            args = '"{mediainfo_bin_location}" --Output=JSON "{ifo_file}"'.format(
-                mediainfo_bin_location=Settings.paths['mediainfo_bin_path'],
-                ifo_file=ifo_file
-                )
-            mediainfo_json = subprocess.check_output(args, shell=True).decode()
-            mediainfo_json = json.loads(mediainfo_json)
+            mediainfo_json = ifo_infos[ifo_file]
 
             for track in mediainfo_json['media']['track']:
                 if track['@type'] == 'General':
@@ -0,0 +1,198 @@
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from HostStats import HostStats
+from ImageUploader import ImageUploader, SUPPORTED_HOSTS
+from Settings import Settings
+
+
+class FanoutUploader:
+    """
+    Uploads to a ranked list of image hosts instead of a single one, and keeps the result of the first host that
+    uploads every image. 'race' starts all hosts at once. 'failover' starts with the first host, and brings in the
+    next one when a host fails, or when it has not finished upload_failover_secs after the last image was
+    produced; the slow host keeps going, and whichever finishes first wins. Hosts are ranked by upload_hosts, or
+    by their HostStats when that is empty. Has the interface of ImageUploader
+    """
+    def __init__(self, images, gallery_name, image_host_id=-1, mode='failover', settings=Settings):
+        """
+        :param image_host_id: the chosen host; ranked first among hosts without statistics
+        :param mode: (str) 'race' or 'failover'
+        :param settings: Settings, or a Config
+        """
+        assert mode in ('race', 'failover'), f'Error: Unknown fan-out mode: {mode}'
+
+        self.images = images
+        self.gallery_name = gallery_name
+        self.mode = mode
+        self.settings = settings
+        self.host_ids = FanoutUploader._get_ranked_host_ids(image_host_id, settings)
+        assert self.host_ids, 'Error: No image host has been set up for fan-out uploads'
+
+        # uploader of the host whose result is used
+        self.uploader = None
+
+    @staticmethod
+    def create(images, gallery_name, image_host_id=-1, settings=Settings):
+        """
+        :return: a FanoutUploader if the upload_fanout setting is set, otherwise an ImageUploader for the chosen host
+        """
+        if settings.performance['upload_fanout']:
+            return FanoutUploader(images, gallery_name, image_host_id=image_host_id,
+                                  mode=settings.performance['upload_fanout'], settings=settings)
+        return ImageUploader(images, gallery_name, image_host_id=image_host_id, settings=settings)
+
+    def get_image_urls(self):
+        return self.uploader.get_image_urls()
+
+    def get_image_url_lines(self):
+        return self.uploader.get_image_url_lines()
+
+    def get_bytes_saved(self):
+        return self.uploader.get_bytes_saved()
+
+    @property
+    def image_host(self):
+        return self.uploader.image_host
+
+    def upload(self):
+        self.upload_stream(list(self.images))
+
+    def upload_stream(self, images):
+        """
+        :param images: iterable of file paths (str), e.g. ScreenshotGenerator.iter_screenshots(); it is consumed
+                       once and replayed to every host
+        """
+        image_buffer = _ImageBuffer()
+        uploaders = [ImageUploader([], self.gallery_name, image_host_id=host_id, settings=self.settings)
+                     for host_id in self.host_ids]
+        n_started = len(uploaders) if self.mode == 'race' else 1
+
+        executor = ThreadPoolExecutor(max_workers=len(uploaders) + 1)
+        try:
+            feeder = executor.submit(image_buffer.feed, images)
+            running = {executor.submit(uploader.upload_stream, image_buffer.iter()): uploader
+                       for uploader in uploaders[:n_started]}
+            # the next host is brought in when this passes; only set once every image has been produced
+            deadline = None
+
+            while self.uploader is None:
+                timeout = None
+                if deadline is not None and n_started < len(uploaders):
+                    timeout = max(0.0, deadline - time.monotonic())
+                done, _ = wait(list(running) + ([feeder] if deadline is None else []), timeout=timeout,
+                               return_when=FIRST_COMPLETED)
+
+                if deadline is None and feeder.done():
+                    # screenshot errors are not the hosts' fault; no other host can do better
+                    feeder.result()
+                    deadline = time.monotonic() + self.settings.performance['upload_failover_secs']
+
+                for future in done:
+                    if future is feeder:
+                        continue
+                    uploader = running.pop(future)
+                    if future.exception() is None:
+                        self.uploader = uploader
+                        break
+                    print('Upload to {} failed: {!r}'.format(uploader.image_host['name'], future.exception()))
+
+                if self.uploader is not None:
+                    break
+                # a host failed, or the failover budget ran out
+                host_failed = any(future is not feeder for future in done)
+                budget_spent = deadline is not None and not done
+                if (host_failed or budget_spent) and n_started < len(uploaders):
+                    uploader = uploaders[n_started]
+                    n_started += 1
+                    print('Uploading to {} as well'.format(uploader.image_host['name']))
+                    running[executor.submit(uploader.upload_stream, image_buffer.iter())] = uploader
+                    if deadline is not None:
+                        deadline = time.monotonic() + self.settings.performance['upload_failover_secs']
+                if not running and n_started == len(uploaders):
+                    raise RuntimeError('Error: Uploading to every image host failed: ' +
+                                       ', '.join(uploader.image_host['name'] for uploader in uploaders))
+        finally:
+            image_buffer.close()
+            # the hosts that lost stop their requests at the next chunk, so they don't keep uploading in the
+            # background; the interpreter still waits for them at exit, at most upload_timeout for a response
+            for uploader in uploaders:
+                if uploader is not self.uploader:
+                    uploader.cancel()
+            # shut down without waiting, so hosts that lost the race don't hold up the result; cancel_futures is
+            # new in Python 3.9
+            if sys.version_info >= (3, 9):
+                executor.shutdown(wait=False, cancel_futures=True)
+            else:
+                executor.shutdown(wait=False)
+
+        self.images = self.uploader.images
+
+    @staticmethod
+    def _get_ranked_host_ids(image_host_id, settings):
+        """
+        :return: (list) of settings.image_hosts indexes of the hosts to upload to, best first; hosts without upload
+                 support (ahdimg) are left out, also when upload_hosts names them
+        """
+        host_ids = {image_host['name']: i for i, image_host in enumerate(settings.image_hosts)
+                    if image_host['name'] in SUPPORTED_HOSTS and image_host['api_key'].strip() != ''}
+
+        if settings.performance['upload_hosts']:
+            return [host_ids[host_name] for host_name in settings.performance['upload_hosts'] if host_name in host_ids]
+
+        # the chosen host goes first among the hosts without statistics
+        host_names = sorted(host_ids, key=lambda host_name: host_ids[host_name] != image_host_id)
+        return [host_ids[host_name] for host_name in HostStats.rank(host_names, settings)]
+
+
+class _ImageBuffer:
+    """
+    Records the images of an iterable as they are produced, so each host can iterate over all of them at its own
+    pace
+    """
+    def __init__(self):
+        self.images = []
+        self.is_complete = False
+        self.is_closed = False
+        self._condition = threading.Condition()
+
+    def feed(self, images):
+        try:
+            for image in images:
+                with self._condition:
+                    if self.is_closed:
+                        return
+                    self.images.append(image)
+                    self._condition.notify_all()
+        except Exception:
+            # the hosts must not take a partial set of images for a complete one
+            self.close()
+            raise
+
+        with self._condition:
+            self.is_complete = True
+            self._condition.notify_all()
+
+    def iter(self):
+        i = 0
+        while True:
+            with self._condition:
+                while i == len(self.images) and not self.is_complete and not self.is_closed:
+                    self._condition.wait()
+                if self.is_closed:
+                    raise RuntimeError('Upload cancelled')
+                if i == len(self.images):
+                    return
+                image = self.images[i]
+            i += 1
+            yield image
+
+    def close(self):
+        """
+        Stops every iteration that is still going, e.g. for the hosts that lost
+        """
+        with self._condition:
+            self.is_closed = True
+            self._condition.notify_all()
@@ -0,0 +1,58 @@
+import hashlib
+import mmap
+import os
+import threading
+
+import Helper
+from LruMemo import LruMemo
+
+# bytes hashed at the head, middle and tail of a file; smaller files are hashed whole
+SAMPLE_BLOCK_SIZE = 256 * 1024
+
+
+class Fingerprint:
+    """
+    Identifies content rather than paths: hardlinks and copies of a release under other paths get the same
+    fingerprint. A file's fingerprint is its size plus a hash of memory-mapped blocks from its head, middle and
+    tail, so only 768 KB of a multi-GB file is read
+    """
+    _memo = LruMemo()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_release_fingerprint(files):
+        """
+        :param files: (list) of file paths (str) that make up the release, in a stable order, e.g. the main VOB set
+                      of a DVD or the episodes of a pack
+        :return: (str)
+        """
+        sha1 = hashlib.sha1()
+        for file in files:
+            sha1.update(Fingerprint.get_file_fingerprint(file).encode())
+        return sha1.hexdigest()
+
+    @staticmethod
+    def get_file_fingerprint(file):
+        """
+        :param file: file path (str)
+        :return: (str) size and sampled hash
+        """
+        key = Helper.get_file_key(file)
+        with Fingerprint._lock:
+            if key in Fingerprint._memo:
+                return Fingerprint._memo[key]
+
+        size = os.path.getsize(file)
+        sha1 = hashlib.sha1()
+        with open(file, 'rb') as f:
+            if size <= 3 * SAMPLE_BLOCK_SIZE:
+                sha1.update(f.read())
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    for offset in (0, (size - SAMPLE_BLOCK_SIZE) // 2, size - SAMPLE_BLOCK_SIZE):
+                        sha1.update(data[offset:offset + SAMPLE_BLOCK_SIZE])
+        fingerprint = '{}-{}'.format(size, sha1.hexdigest())
+
+        with Fingerprint._lock:
+            Fingerprint._memo[key] = fingerprint
+        return fingerprint
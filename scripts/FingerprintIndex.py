@@ -0,0 +1,82 @@
+import json
+import time
+
+from DiskCache import DiskCache
+from Settings import Settings
+
+
+class FingerprintIndex:
+    """
+    Maps release fingerprints (see Fingerprint) to earlier results: the mediainfo of every relevant file, and the
+    uploaded image urls per image host and options. A release that was already processed under another path is
+    reused whole, without probing, extracting or uploading again
+    """
+    @staticmethod
+    def get_media_infos(fingerprint, settings=Settings):
+        """
+        :param settings: Settings, or a Config
+        :return: (list) of mediainfo texts, one per relevant file, or None
+        """
+        if not settings.performance['fingerprint_index']:
+            return None
+        return FingerprintIndex._get_disk_cache(settings).get_json(f'{fingerprint}|mediainfo')
+
+    @staticmethod
+    def put_media_infos(fingerprint, media_infos, settings=Settings):
+        if settings.performance['fingerprint_index']:
+            FingerprintIndex._get_disk_cache(settings).put_json(f'{fingerprint}|mediainfo', media_infos)
+
+    @staticmethod
+    def get_uploaded(rls, options, settings=Settings):
+        """
+        :param rls: (ReleaseInfo) probed release
+        :param options: (dict) image host and everything else that changes the uploaded images
+        :return: (dict) 'image_urls', 'image_url_lines' and 'image_sources' as ReleaseInfo.get_report() takes them,
+                 or None if the release was not uploaded with these options, or only longer ago than the upload
+                 index TTL
+        """
+        if not settings.performance['fingerprint_index']:
+            return None
+        entry = FingerprintIndex._get_disk_cache(settings).get_json(FingerprintIndex._get_uploaded_key(rls, options))
+        if entry is None or time.time() - entry['created'] > settings.performance['upload_index_ttl_days'] * 86400:
+            return None
+
+        # screenshots are referred to by number, and their sources by position in the release, so the urls fit the
+        # video files of this path
+        image_url_lines = None
+        if entry['image_url_lines'] is not None:
+            image_url_lines = [(f'#{i}', url_text) for i, url_text in enumerate(entry['image_url_lines'])]
+        image_sources = {f'#{i}': rls.main_video_files[file_index]
+                         for i, file_index in enumerate(entry['image_source_indexes'])
+                         if file_index is not None and file_index < len(rls.main_video_files)}
+        return {'image_urls': entry['image_urls'], 'image_url_lines': image_url_lines, 'image_sources': image_sources}
+
+    @staticmethod
+    def put_uploaded(rls, options, uploaded, settings=Settings):
+        """
+        :param uploaded: (dict) as returned by get_uploaded()
+        """
+        if not settings.performance['fingerprint_index']:
+            return
+
+        image_url_lines = uploaded['image_url_lines']
+        image_source_indexes = []
+        for image, _ in image_url_lines or []:
+            source = uploaded['image_sources'].get(image)
+            image_source_indexes.append(rls.main_video_files.index(source) if source in rls.main_video_files
+                                        else None)
+
+        FingerprintIndex._get_disk_cache(settings).put_json(FingerprintIndex._get_uploaded_key(rls, options), {
+            'image_urls': uploaded['image_urls'],
+            'image_url_lines': None if image_url_lines is None else [url_text for _, url_text in image_url_lines],
+            'image_source_indexes': image_source_indexes,
+            'created': time.time()
+        })
+
+    @staticmethod
+    def _get_uploaded_key(rls, options):
+        return '{}|{}'.format(rls.fingerprint, json.dumps(options, sort_keys=True))
+
+    @staticmethod
+    def _get_disk_cache(settings):
+        return DiskCache.get_shared('fingerprints', settings.performance['fingerprint_index_max_bytes'], settings)
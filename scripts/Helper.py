@@ -1,23 +1,95 @@
 import os
+import re
+
+from Settings import Settings
+
+# tokens that end the title part of a release name: resolution, episode numbering and common source/codec tags
+RELEASE_TAG_REGEX = re.compile(
+    r'^(?:\d{3,4}[pi]|4k|uhd|s\d{1,2}(?:e\d{1,3})*|blu-?ray|bd(?:rip|remux)?|remux|web(?:-?dl|-?rip)?|hdtv|'
+    r'dvd(?:rip|[59])?|hd-?dvd|ntsc|pal|x26[45]|h-?26[45]|hevc|avc|xvid|divx|10bit|hdr(?:10)?|dv|proper|repack|'
+    r'extended|unrated|remastered|criterion|complete|(?:dd|ddp|dts|aac|ac3|flac|truehd|atmos)\S*)$',
+    re.IGNORECASE
+)
+# release tags that are also ordinary title words ("The Complete Works", "My Pal Joey")
+TITLE_WORD_TAG_REGEX = re.compile(
+    r'^(?:4k|uhd|ntsc|pal|dv|proper|repack|extended|unrated|remastered|criterion|complete)$',
+    re.IGNORECASE
+)
+# words guessit takes out of the title as another property: part, volume and disc numbers, editions, countries and
+# languages ("Kill.Bill.Vol.1.2003", "Dune.Part.Two.2024", "The.Office.US.S01")
+TITLE_PROPERTY_REGEX = re.compile(
+    r'^(?:vol(?:ume)?|part|pt|cd\d*|dis[ck]\d*|ep(?:isode)?|season|edition|version|collectors|cut|uncut|theatrical|limited|alternate|imax|3d|'
+    r'uncensored|restored|colou?rized|matte|widescreen|internal|retail|bonus|extras|dual|audio|multi|dubbed|subbed|'
+    r'subs|vostfr|vff|us|usa|uk|gb|au|fr|es|jp|en|nl|se|br|ru|eng|ita|fre|ger|spa|rus|jpn|english|(?:true)?french|'
+    r'german|italian|spanish|hindi|korean|japanese|swedish|polish)$',
+    re.IGNORECASE
+)
+YEAR_REGEX = re.compile(r'^(?:19|20)\d{2}$')
+SCREEN_SIZE_REGEX = re.compile(r'^(\d{3,4})([pi])$', re.IGNORECASE)
 
 
 def get_largest_file(files):
-    largest_filepath = files[0]
-    largest_filesize = os.path.getsize(files[0])
+    return max(files, key=os.path.getsize)
+
+
+def get_file_key(file):
+    """
+    Identifies a file by its location and state, so cached results are invalidated once the file changes
+    :param file: file path (str)
+    :return: (str)
+    """
+    stat = os.stat(file)
+    return '{}|{}|{}'.format(os.path.abspath(file), stat.st_size, stat.st_mtime_ns)
+
+
+def get_path_signature(path):
+    """
+    Cheap identity of a file or a whole directory tree (e.g. a DVD folder or a pack), from stat calls only
+    :param path: file or directory path (str)
+    :return: (str) total size, newest mtime and file count; None if the path vanished
+    """
+    try:
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            return '{}|{}|1'.format(stat.st_size, stat.st_mtime_ns)
+
+        total_size = newest_mtime = n_files = 0
+        dirs = [path]
+        while dirs:
+            with os.scandir(dirs.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.path)
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        total_size += stat.st_size
+                        newest_mtime = max(newest_mtime, stat.st_mtime_ns)
+                        n_files += 1
+        return '{}|{}|{}'.format(total_size, newest_mtime, n_files)
+    except OSError:
+        return None
 
-    for file in files:
-        filesize = os.path.getsize(file)
-        if filesize > largest_filesize:
-            largest_filepath = file
-            largest_filesize = filesize
 
-    return largest_filepath
+def get_cache_dir(settings=Settings):
+    """
+    :param settings: Settings, or a Config
+    """
+    cache_dir = settings.performance['cache_dir'] or \
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+    return os.path.expanduser(cache_dir)
 
 
 def get_gallery_name(input_path):
-    from guessit import guessit
+    """
+    :param input_path: release path (str)
+    :return: (str) "Title (Year) - Resolution"; year and resolution only if the release name has them
+    """
+    guessed_data = _parse_release_name(input_path)
+    if guessed_data is None:
+        # guessit takes most of a second to import, so it is only used for names the parser above gives up on
+        from guessit import guessit
+        guessed_data = guessit(input_path)
 
-    guessed_data = guessit(input_path)
     gallery_name = guessed_data['title']
     if guessed_data.get('year') is not None:
         gallery_name += ' ({year})'.format(year=guessed_data['year'])
@@ -26,3 +98,49 @@ def get_gallery_name(input_path):
         gallery_name += ' - {res}'.format(res=guessed_data['screen_size'])
 
     return gallery_name
+
+
+def _parse_release_name(input_path):
+    """
+    Approximates guessit on scene-style release names ("Title.Year.1080p.Source-GROUP", "Title (Year) [1080p]") for
+    the fields used in the gallery name: the title ends at the last year, or without a year at the first release
+    tag. Names where that is ambiguous are left to guessit: a release tag before the year, which may be part of the
+    title, no year and a first tag that is also an ordinary word, or a title word guessit may take as another
+    property (part, volume, edition, country, language)
+    :param input_path: release path (str)
+    :return: (dict) 'title' and, if found, 'year' (int) and 'screen_size' (str), or None if the name isn't
+             recognized
+    """
+    name = os.path.basename(os.path.normpath(input_path))
+    if os.path.isfile(input_path):
+        name = os.path.splitext(name)[0]
+    tokens = [token.strip('()[]{}') for token in re.split(r'[\s._]+', name)]
+    tokens = [token for token in tokens if token]
+
+    tag_index = next((i for i, token in enumerate(tokens) if RELEASE_TAG_REGEX.match(token)), len(tokens))
+    year_indexes = [i for i in range(1, len(tokens)) if YEAR_REGEX.match(tokens[i])]
+    if year_indexes:
+        title_end = year_indexes[-1]
+        if tag_index < title_end:
+            return None
+    else:
+        if tag_index == len(tokens) or TITLE_WORD_TAG_REGEX.match(tokens[tag_index]):
+            return None
+        title_end = tag_index
+
+    if any(TITLE_PROPERTY_REGEX.match(token) for token in tokens[1:title_end]):
+        return None
+
+    title = ' '.join(tokens[:title_end]).strip(' -')
+    if not title:
+        return None
+
+    parsed = {'title': title}
+    if year_indexes:
+        parsed['year'] = int(tokens[title_end])
+    for token in tokens[title_end:]:
+        screen_size_match = SCREEN_SIZE_REGEX.match(token)
+        if screen_size_match:
+            parsed['screen_size'] = screen_size_match.group(1) + screen_size_match.group(2).lower()
+            break
+    return parsed
@@ -0,0 +1,115 @@
+import json
+import os
+import tempfile
+import threading
+
+import Helper
+from Settings import Settings
+
+# weight of the newest request in the rolling averages
+EWMA_ALPHA = 0.2
+
+
+class HostStats:
+    """
+    Rolling per-host upload statistics, kept on disk between runs: an exponentially weighted moving average of the
+    request latency and of the error rate. Fan-out uploads (see FanoutUploader) use them to rank the image hosts.
+    Requests are recorded in memory; save() writes them out, once per release
+    """
+    file_name = 'host_stats.json'
+
+    # stats file path -> statistics per host
+    _stats = {}
+    # stats file path -> (latency_secs, ok) per host, of the requests recorded since the last save()
+    _pending = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def record(host_name, latency_secs, ok, settings=Settings):
+        """
+        :param host_name: (str) image host name, as in Settings.image_hosts
+        :param latency_secs: (float) duration of the request, including failed ones
+        :param ok: (bool) False for connection errors, timeouts and error responses
+        :param settings: Settings, or a Config; decides where the statistics are kept
+        """
+        filepath = HostStats._get_filepath(settings)
+        with HostStats._lock:
+            HostStats._update(HostStats._load(filepath), host_name, latency_secs, ok)
+            HostStats._pending.setdefault(filepath, {}).setdefault(host_name, []).append((latency_secs, ok))
+
+    @staticmethod
+    def save(settings=Settings):
+        """
+        Writes the requests recorded since the last call. They are applied to the statistics on disk as they are
+        now, so other processes that share the cache directory don't lose their requests to this one
+        :param settings: Settings, or a Config; decides where the statistics are kept
+        """
+        filepath = HostStats._get_filepath(settings)
+        with HostStats._lock:
+            pending = HostStats._pending.pop(filepath, None)
+            if not pending:
+                return
+
+            HostStats._stats.pop(filepath, None)
+            stats = HostStats._load(filepath)
+            for host_name, requests in pending.items():
+                for latency_secs, ok in requests:
+                    HostStats._update(stats, host_name, latency_secs, ok)
+            HostStats._save(filepath, stats)
+
+    @staticmethod
+    def get_score(host_name, settings=Settings):
+        """
+        :return: (float) expected seconds until a request succeeds (average latency over success rate), lower is
+                 better; None for hosts without statistics
+        """
+        filepath = HostStats._get_filepath(settings)
+        with HostStats._lock:
+            host_stats = HostStats._load(filepath).get(host_name)
+        if host_stats is None:
+            return None
+        return host_stats['latency_secs'] / max(0.05, 1.0 - host_stats['error_rate'])
+
+    @staticmethod
+    def rank(host_names, settings=Settings):
+        """
+        Orders hosts by score. Hosts without statistics go last, in their given order
+        :param host_names: (list) of image host names (str)
+        :return: (list)
+        """
+        scores = {host_name: HostStats.get_score(host_name, settings) for host_name in host_names}
+        return sorted(host_names, key=lambda host_name: (scores[host_name] is None, scores[host_name] or 0.0))
+
+    @staticmethod
+    def _update(stats, host_name, latency_secs, ok):
+        host_stats = stats.get(host_name)
+        if host_stats is None:
+            host_stats = {'latency_secs': latency_secs, 'error_rate': 0.0 if ok else 1.0, 'n_requests': 0}
+        else:
+            host_stats['latency_secs'] += EWMA_ALPHA * (latency_secs - host_stats['latency_secs'])
+            host_stats['error_rate'] += EWMA_ALPHA * ((0.0 if ok else 1.0) - host_stats['error_rate'])
+        host_stats['n_requests'] += 1
+        stats[host_name] = host_stats
+
+    @staticmethod
+    def _load(filepath):
+        if filepath not in HostStats._stats:
+            try:
+                with open(filepath, 'r', encoding='utf8') as f:
+                    HostStats._stats[filepath] = json.load(f)
+            except (OSError, ValueError):
+                HostStats._stats[filepath] = {}
+        return HostStats._stats[filepath]
+
+    @staticmethod
+    def _save(filepath, stats):
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        # a temp file of its own, so processes saving at the same time don't write into each other's
+        fd, temp_filepath = tempfile.mkstemp(dir=os.path.dirname(filepath), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf8') as f:
+            json.dump(stats, f, indent=4)
+        os.replace(temp_filepath, filepath)
+
+    @staticmethod
+    def _get_filepath(settings):
+        return os.path.join(Helper.get_cache_dir(settings), HostStats.file_name)
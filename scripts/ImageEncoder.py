@@ -0,0 +1,133 @@
+import io
+import os
+import tempfile
+
+from Profiler import Profiler
+from Settings import Settings
+
+# output format per image host, and the largest file the host accepts (None: no known limit)
+HOST_ENCODINGS = {
+    'ptpimg': {'format': 'PNG', 'max_bytes': None},
+    'imgbb': {'format': 'WEBP', 'max_bytes': 32 * 1024 * 1024},
+    'hdbimg': {'format': 'PNG', 'max_bytes': None},
+    'ahdimg': {'format': 'PNG', 'max_bytes': None}
+}
+FILE_EXTENSIONS = {'PNG': '.png', 'WEBP': '.webp', 'JPEG': '.jpg'}
+# lossy qualities tried, best first, when no lossless encoding fits under a host's size limit
+FALLBACK_JPEG_QUALITIES = (95, 90, 85, 80)
+
+
+class ImageEncoder:
+    """
+    Re-compresses screenshots before they are uploaded: losslessly into the format of the image host (PNG with a
+    tuned zlib level and per-row filter selection, or lossless WebP), as a palette image when a frame has no more
+    than 256 colours, and without metadata chunks. Only if nothing lossless fits under the host's size limit is the
+    image stored as JPEG. The screenshot itself is never changed; the encoded image is a separate file, see remove()
+    """
+    @staticmethod
+    def encode(image, host_name, settings=Settings):
+        """
+        :param image: file path (str) of a screenshot
+        :param host_name: (str) name of the image host, see HOST_ENCODINGS
+        :param settings: Settings, or a Config
+        :return: (dict) 'path' of the image to upload, its size before ('bytes_in') and after ('bytes_out'); the
+                 path is either the screenshot itself or a new file that the caller removes after the upload
+        """
+        bytes_in = os.path.getsize(image)
+        if not settings.performance['encode_images']:
+            return {'path': image, 'bytes_in': bytes_in, 'bytes_out': bytes_in}
+
+        from PIL import Image
+
+        host_encoding = HOST_ENCODINGS.get(host_name, {'format': 'PNG', 'max_bytes': None})
+        max_bytes = host_encoding['max_bytes']
+
+        with Profiler.span('encode', 'encode', path=image, format=host_encoding['format']) as info:
+            with Image.open(image) as im:
+                source_format = im.format
+                im.load()
+
+            image_format = host_encoding['format']
+            data = ImageEncoder._encode_lossless(im, image_format, settings)
+
+            if source_format == image_format and len(data) >= bytes_in and (max_bytes is None or bytes_in <= max_bytes):
+                # ffmpeg's file is already the smaller one
+                info['bytes_in'] = info['bytes_out'] = bytes_in
+                return {'path': image, 'bytes_in': bytes_in, 'bytes_out': bytes_in}
+
+            if max_bytes is not None and len(data) > max_bytes:
+                image_format, data = ImageEncoder._encode_to_fit(im, max_bytes, settings)
+
+            # a directory of its own keeps the screenshot's file name, which hdbimg shows, and keeps concurrent
+            # encodes of the same screenshot for different hosts apart
+            encoded_dir = tempfile.mkdtemp(prefix='.encoded-', dir=os.path.dirname(image))
+            encoded_image = os.path.join(encoded_dir, os.path.splitext(os.path.basename(image))[0] +
+                                         FILE_EXTENSIONS[image_format])
+            with open(encoded_image, 'wb') as f:
+                f.write(data)
+
+            info['bytes_in'] = bytes_in
+            info['bytes_out'] = len(data)
+        return {'path': encoded_image, 'bytes_in': bytes_in, 'bytes_out': len(data)}
+
+    @staticmethod
+    def remove(image, encoded_image):
+        """
+        Removes the file encode() wrote, if it wrote one
+        :param image: file path (str) passed to encode()
+        :param encoded_image: 'path' returned by encode()
+        """
+        if encoded_image == image:
+            return
+        try:
+            os.remove(encoded_image)
+            os.rmdir(os.path.dirname(encoded_image))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _encode_lossless(im, image_format, settings):
+        buffer = io.BytesIO()
+        if image_format == 'WEBP':
+            im.save(buffer, 'WEBP', lossless=True, quality=100, method=settings.performance['webp_method'])
+        else:
+            if settings.performance['encode_palette']:
+                im = ImageEncoder._to_palette(im)
+            # Pillow picks the PNG filter per row
+            im.save(buffer, 'PNG', compress_level=settings.performance['png_compress_level'])
+        return buffer.getvalue()
+
+    @staticmethod
+    def _encode_to_fit(im, max_bytes, settings):
+        """
+        :return: (tuple) format (str) and encoded bytes of the first encoding under max_bytes
+        """
+        for image_format in ('PNG', 'WEBP'):
+            data = ImageEncoder._encode_lossless(im, image_format, settings)
+            if len(data) <= max_bytes:
+                return image_format, data
+
+        rgb_im = im.convert('RGB')
+        for quality in FALLBACK_JPEG_QUALITIES:
+            buffer = io.BytesIO()
+            rgb_im.save(buffer, 'JPEG', quality=quality, optimize=True)
+            if buffer.tell() <= max_bytes:
+                print(f'Warning: image exceeds the host size limit losslessly, stored as JPEG with quality {quality}')
+                return 'JPEG', buffer.getvalue()
+
+        assert False, f'Error: image can not be encoded under the host size limit of {max_bytes} bytes'
+
+    @staticmethod
+    def _to_palette(im):
+        """
+        :return: a palette image if im has at most 256 colours and converts without loss, otherwise im
+        """
+        from PIL import Image, ImageChops
+
+        if im.mode not in ('RGB', 'L') or im.getcolors(256) is None:
+            return im
+
+        palette_im = im.convert('P', palette=Image.Palette.ADAPTIVE, colors=256)
+        if ImageChops.difference(palette_im.convert(im.mode), im).getbbox() is not None:
+            return im
+        return palette_im
@@ -1,110 +1,313 @@
-import base64
 import datetime
-import requests
+import hashlib
 import os
+import threading
+import time
 
+from concurrent.futures import ThreadPoolExecutor
 from string import Template
+from HostStats import HostStats
+from ImageEncoder import ImageEncoder
+from Profiler import Profiler
 from Settings import Settings
+from StreamingMultipart import StreamingMultipart
+from UploadIndex import UploadIndex
 
 ENDPOINT_PTPIMG = 'https://ptpimg.me/upload.php'
 ENDPOINT_IMGBB = 'https://api.imgbb.com/1/upload'
 ENDPOINT_HDBIMG = 'https://img.hdbits.org/upload_api.php'
 ENDPOINT_AHDIMG = 'https://img.awesome-hd.me/api/upload'
 
+# responses worth another attempt; everything else is final
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# hosts that can be uploaded to; ahdimg is in the settings, but has no upload support yet
+SUPPORTED_HOSTS = ('ptpimg', 'imgbb', 'hdbimg')
+
 
 class ImageUploader:
     img_url_template = Template('[url=$direct_url][img]$thumb_url[/img][/url]')
     # basic tagging for the image hosts that don't provide thumb urls
     basic_img_url_template = Template('[img]$direct_url[/img]')
 
-    def __init__(self, images, gallery_name, image_host_id=-1):
+    # shared by every uploader, so connections are kept alive and reused across images and hosts
+    _session = None
+    _session_lock = threading.Lock()
+
+    def __init__(self, images, gallery_name, image_host_id=-1, settings=Settings):
+        """
+        :param images: (list) of file paths (str); may be empty when the images are passed to upload_stream()
+        :param settings: Settings, or a Config
+        """
         assert image_host_id != -1, 'Error: No image host has been chosen'
 
-        self.image_host = Settings.image_hosts[image_host_id]
+        self.settings = settings
+        self.image_host = settings.image_hosts[image_host_id]
         self.images = images
+        self.gallery_name = gallery_name
         self.image_urls = ''
+        # (image path, url text) per image, in image order; None for hosts that answer for the whole gallery
+        self.image_url_lines = []
+        # total size of the uploaded images before and after re-encoding
+        self.encode_stats = {'bytes_in': 0, 'bytes_out': 0}
+        self._encode_stats_lock = threading.Lock()
+        # set by cancel(); request bodies being sent, so cancel() can abort them
+        self._cancelled = threading.Event()
+        self._bodies = set()
+        self._bodies_lock = threading.Lock()
 
     def get_image_urls(self):
         return self.image_urls
 
+    def get_image_url_lines(self):
+        return self.image_url_lines
+
+    def get_bytes_saved(self):
+        return self.encode_stats['bytes_in'] - self.encode_stats['bytes_out']
+
     def upload(self):
+        self.upload_stream(list(self.images))
+
+    def cancel(self):
+        """
+        Stops the upload from another thread, e.g. for the hosts that lost a fan-out: no further images are
+        encoded and no further attempts are made, and request bodies being sent stop at their next chunk. A
+        response that is already being waited for still takes up to upload_timeout
+        """
+        self._cancelled.set()
+        with self._bodies_lock:
+            for body in self._bodies:
+                body.abort()
+
+    def upload_stream(self, images):
+        """
+        Uploads images while they are still being produced: every image is handed to the upload pool as soon as
+        the iterable yields it. Hosts that need all images in a single request (hdbimg galleries) are flushed once
+        the iterable is exhausted
+        :param images: iterable of file paths (str), e.g. ScreenshotGenerator.iter_screenshots()
+        """
+        self.images = []
+        self.image_urls = ''
+        self.image_url_lines = []
+        images = self._record_images(images)
+
         if self.image_host['name'] == 'ptpimg':
-            self._upload_ptpimg()
+            self._upload_ptpimg(images)
         elif self.image_host['name'] == 'imgbb':
-            self._upload_imgbb()
+            self._upload_imgbb(images)
         elif self.image_host['name'] == 'hdbimg':
+            list(images)
             self._upload_hdbimg()
         elif self.image_host['name'] == 'ahdimg':
-            print('Error: ahdimg is not yet implemented on this script. Site currently down for testing.')
-            exit()
-
-    def _upload_imgbb(self):
-        for i, image in enumerate(self.images):
-            now = datetime.datetime.now().strftime('%Y-%m-%d %H-%M-%S')
-            with open(image, 'rb') as f:
-                formdata = {
-                    'key': self.image_host['api_key'],
-                    'image': base64.b64encode(f.read()),
-                    'name': f'{i}_snapshot {now}'
-                }
-                resp = requests.post(url=ENDPOINT_IMGBB, data=formdata)
-
-            assert resp.ok, f'IMGBB returned status code {resp.status_code}'
-            resp_json = resp.json()
-            direct_url = resp_json['data']['image']['url']
-            thumb_url = resp_json['data']['medium']['url']
-
-            if Settings.use_bbcode_tags:
-                self.image_urls += self.img_url_template.safe_substitute(
-                    direct_url=direct_url,
-                    thumb_url=thumb_url
-                ) + '\n'
-            else:
-                self.image_urls += direct_url + '\n'
+            raise RuntimeError('Error: ahdimg is not yet implemented on this script. Site currently down for testing.')
 
-    def _upload_ptpimg(self):
-        data = {'api_key': self.image_host['api_key']}
-        files = {}
+    def _record_images(self, images):
+        for image in images:
+            self.images.append(image)
+            yield image
 
-        file_descriptors = [open(img, 'rb') for img in self.images]
-        for i, fd in enumerate(file_descriptors):
-            # ptpimg does not retain filenames
-            files[ f'file-upload[{i}]' ] = ('potatoes_boilem_mashem_ptpimg_dont_care', fd)
+    def _upload_imgbb(self, images):
+        all_urls = self._upload_each(self._upload_imgbb_image, images)
+        for image, urls in zip(self.images, all_urls):
+            if self.settings.use_bbcode_tags:
+                self._add_image_url(image, self.img_url_template.safe_substitute(
+                    direct_url=urls['direct_url'],
+                    thumb_url=urls['thumb_url']
+                ) + '\n')
+            else:
+                self._add_image_url(image, urls['direct_url'] + '\n')
 
-        resp = requests.post(url=ENDPOINT_PTPIMG, files=files, data=data)
-        assert resp.ok, f'PTPIMG returned status code {resp.status_code}'
-        resp_json = resp.json()
+    def _upload_imgbb_image(self, i, image):
+        now = datetime.datetime.now().strftime('%Y-%m-%d %H-%M-%S')
+        fields = [('key', self.image_host['api_key']), ('name', f'{i}_snapshot {now}')]
+        # the image is base64-encoded chunk by chunk while it is sent, never as a whole
+        with StreamingMultipart(fields=fields, base64_files=[('image', image)]) as body:
+            resp = self._post('IMGBB', ENDPOINT_IMGBB, body)
 
-        image_urls = ['https://ptpimg.me/{}.png'.format(img['code']) for img in resp_json]
+        resp_json = resp.json()
+        return {'direct_url': resp_json['data']['image']['url'], 'thumb_url': resp_json['data']['medium']['url']}
 
-        for direct_url in image_urls:
-            if Settings.use_bbcode_tags:
-                self.image_urls += self.basic_img_url_template.safe_substitute(
-                    direct_url=direct_url
-                ) + '\n'
+    def _upload_ptpimg(self, images):
+        # ptpimg takes any number of files per request; one image per request lets the uploads run concurrently
+        all_urls = self._upload_each(self._upload_ptpimg_image, images)
+        for image, urls in zip(self.images, all_urls):
+            if self.settings.use_bbcode_tags:
+                self._add_image_url(image, self.basic_img_url_template.safe_substitute(
+                    direct_url=urls['direct_url']
+                ) + '\n')
             else:
-                self.image_urls += direct_url + '\n'
-        [fd.close() for fd in file_descriptors]
+                self._add_image_url(image, urls['direct_url'] + '\n')
+
+    def _add_image_url(self, image, url_text):
+        self.image_url_lines.append((image, url_text))
+        self.image_urls += url_text
+
+    def _upload_ptpimg_image(self, i, image):
+        fields = [('api_key', self.image_host['api_key'])]
+        # ptpimg does not retain filenames
+        files = [('file-upload[0]', 'potatoes_boilem_mashem_ptpimg_dont_care', image)]
+
+        with StreamingMultipart(fields=fields, files=files) as body:
+            resp = self._post('PTPIMG', ENDPOINT_PTPIMG, body)
+
+        resp_json = resp.json()
+        return {'direct_url': 'https://ptpimg.me/{}.{}'.format(resp_json[0]['code'], resp_json[0].get('ext', 'png'))}
 
     def _upload_hdbimg(self):
+        self.image_url_lines = None
+
+        # the whole gallery is indexed as one entry, keyed by the hashes of all its images
+        content_hash = hashlib.sha256(''.join(UploadIndex.hash_file(img) for img in self.images).encode()).hexdigest()
+        cached_urls = UploadIndex.get(content_hash, self.image_host['name'], self.settings)
+        if cached_urls is not None:
+            self.image_urls = cached_urls['text']
+            return
+
+        with ThreadPoolExecutor(max_workers=max(1, self.settings.performance['encode_workers'])) as executor:
+            encoded_images = list(executor.map(self._encode, self.images))
+
+        try:
+            # all images go into a single request, otherwise each request would create its own gallery; only a
+            # gallery over the request size limit is split into several
+            batches = self._split_hdbimg_batches(encoded_images)
+            for i, batch in enumerate(batches):
+                gallery_name = self.gallery_name if len(batches) == 1 else \
+                    f'{self.gallery_name} ({i + 1}/{len(batches)})'
+                with self._get_hdbimg_body(batch, gallery_name) as body:
+                    resp = self._post('HDBIMG', ENDPOINT_HDBIMG, body)
+                # image urls come pre-formatted for use within hdbits
+                self.image_urls += resp.text
+        finally:
+            for image, encoded_image in zip(self.images, encoded_images):
+                ImageEncoder.remove(image, encoded_image)
+
+        UploadIndex.put(content_hash, self.image_host['name'], {'text': self.image_urls}, self.settings)
+
+    def _split_hdbimg_batches(self, images):
+        """
+        :return: (list) of lists of images, each small enough for one request; an image that is over the limit on
+                 its own still gets a request
+        """
+        max_bytes = self.settings.performance['hdbimg_max_request_bytes']
+        batches = [[]]
+        for image in images:
+            body = self._get_hdbimg_body(batches[-1] + [image], self.gallery_name)
+            if batches[-1] and max_bytes and len(body) > max_bytes:
+                batches.append([])
+            batches[-1].append(image)
+        return batches
+
+    def _get_hdbimg_body(self, images, gallery_name):
         # galleryoption == '0' indicates no new gallery will be created; value not honored; new gallery is
         # created regardless
         # galleryoption == '1' indicates new gallery will be created
-        data = {
-            'username': self.image_host['username'],
-            'passkey': self.image_host['api_key'],
-            'galleryoption': '1',
-            'galleryname': gallery_name
-        }
-        files = {}
-
-        file_descriptors = [open(img, 'rb') for img in self.images]
-        for i, fd in enumerate(file_descriptors):
-            files[f'images_files[{i}]'] = (os.path.basename(self.images[i]), fd)
-
-        resp = requests.post(url=ENDPOINT_HDBIMG, files=files, data=data)
-        assert resp.ok, f'HDBIMG returned status code {resp.status_code}'
-
-        # image urls come pre-formatted for use within hdbits
-        self.image_urls = resp.text
-        [fd.close() for fd in file_descriptors]
+        fields = [
+            ('username', self.image_host['username']),
+            ('passkey', self.image_host['api_key']),
+            ('galleryoption', '1'),
+            ('galleryname', gallery_name)
+        ]
+        files = [(f'images_files[{i}]', os.path.basename(image), image) for i, image in enumerate(images)]
+        return StreamingMultipart(fields=fields, files=files)
+
+    def _upload_each(self, upload_fn, images):
+        """
+        Uploads every image on its own, concurrently. Images found in the upload index are not uploaded again
+        :param upload_fn: called with (index, image path); returns a dict of urls
+        :param images: iterable of file paths (str); each one is submitted as soon as it is yielded
+        :return: (list) of url dicts, in image order
+        """
+        with ThreadPoolExecutor(max_workers=max(1, self.settings.performance['upload_workers'])) as executor:
+            futures = [executor.submit(self._upload_indexed, upload_fn, i, image) for i, image in enumerate(images)]
+            # results are collected in submission order, regardless of which upload finishes first
+            return [future.result() for future in futures]
+
+    def _upload_indexed(self, upload_fn, i, image):
+        if self._cancelled.is_set():
+            raise RuntimeError('Upload cancelled')
+
+        content_hash = UploadIndex.hash_file(image)
+        urls = UploadIndex.get(content_hash, self.image_host['name'], self.settings)
+        if urls is None:
+            # the index stays keyed by the original image, so a hit skips re-encoding as well
+            encoded_image = self._encode(image)
+            try:
+                urls = upload_fn(i, encoded_image)
+            finally:
+                ImageEncoder.remove(image, encoded_image)
+            UploadIndex.put(content_hash, self.image_host['name'], urls, self.settings)
+        return urls
+
+    def _encode(self, image):
+        """
+        :return: (str) file path of the image re-encoded for the image host; see ImageEncoder.remove()
+        """
+        result = ImageEncoder.encode(image, self.image_host['name'], self.settings)
+        with self._encode_stats_lock:
+            self.encode_stats['bytes_in'] += result['bytes_in']
+            self.encode_stats['bytes_out'] += result['bytes_out']
+        return result['path']
+
+    def _post(self, host_name, url, body):
+        """
+        POSTs through the shared session with a per-request timeout. Connection errors, timeouts and transient
+        status codes are retried with exponential backoff, until cancel() is called. The latency and outcome of every
+        attempt go into HostStats
+        :param host_name: (str) used in the error message
+        :param body: (StreamingMultipart) rewound for every attempt
+        :return: requests.Response
+        """
+        # requests is imported on first use; most of its import time is spent in urllib3 and the TLS setup
+        import requests
+
+        n_attempts = max(1, self.settings.performance['upload_retries'] + 1)
+
+        with self._bodies_lock:
+            self._bodies.add(body)
+        try:
+            for attempt in range(n_attempts):
+                # checked after the body is registered, so a cancel() in between still aborts it
+                if self._cancelled.is_set():
+                    raise RuntimeError('Upload cancelled')
+                # a failed attempt may have consumed part of the body
+                body.seek(0)
+
+                start = time.monotonic()
+                try:
+                    with Profiler.span('POST', 'http', host=host_name, attempt=attempt) as info:
+                        session = ImageUploader._get_session(self.settings.performance['upload_workers'])
+                        resp = session.post(url=url, data=body, headers={'Content-Type': body.content_type},
+                                            timeout=self.settings.performance['upload_timeout'])
+                        info['status_code'] = resp.status_code
+                        info['bytes_in'] = len(resp.content)
+                        info['bytes_out'] = len(body)
+                    HostStats.record(self.image_host['name'], time.monotonic() - start, resp.ok, self.settings)
+                    if resp.status_code not in RETRY_STATUS_CODES or attempt == n_attempts - 1:
+                        break
+                except (requests.ConnectionError, requests.Timeout):
+                    HostStats.record(self.image_host['name'], time.monotonic() - start, False, self.settings)
+                    if attempt == n_attempts - 1:
+                        raise
+                # cut short by cancel()
+                self._cancelled.wait(self.settings.performance['upload_backoff'] * 2 ** attempt)
+
+            assert resp.ok, f'{host_name} returned status code {resp.status_code}'
+            return resp
+        finally:
+            with self._bodies_lock:
+                self._bodies.discard(body)
+
+    @staticmethod
+    def _get_session(pool_maxsize):
+        """
+        :param pool_maxsize: (int) connections kept per host; set by the first caller
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        with ImageUploader._session_lock:
+            if ImageUploader._session is None:
+                adapter = HTTPAdapter(pool_maxsize=max(1, pool_maxsize))
+                ImageUploader._session = requests.Session()
+                ImageUploader._session.mount('https://', adapter)
+                ImageUploader._session.mount('http://', adapter)
+            return ImageUploader._session
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import threading
+
+import Helper
+from Settings import Settings
+from UploadIndex import UploadIndex
+
+
+class JobJournal:
+    """
+    Records the completed stages of one release and their artifacts: the probed release ('probe'), the chosen
+    timestamps ('timestamps'), the kept screenshots with their hashes ('screenshots') and the uploaded urls
+    ('upload'). A run that fails part way leaves its journal behind, and the next run of the same release with the
+    same options picks up at the first stage without an entry. The journal is removed once the report is written
+    """
+    def __init__(self, input_path, options, settings=Settings):
+        """
+        :param input_path: release path (str)
+        :param options: (dict) of everything besides the release that changes the result, e.g. the image host;
+                        a journal written with other options is discarded
+        :param settings: Settings, or a Config
+        """
+        self.enabled = settings.performance['job_journal']
+        journal_name = hashlib.sha1(os.path.abspath(input_path).encode()).hexdigest() + '.json'
+        self.filepath = os.path.join(Helper.get_cache_dir(settings), 'journal', journal_name)
+        self.identity = {'signature': Helper.get_path_signature(input_path) if self.enabled else '',
+                         'options': options}
+        self._lock = threading.Lock()
+        self.stages = self._load() if self.enabled else {}
+
+    def get(self, stage):
+        """
+        :return: the artifact of a completed stage, or None
+        """
+        return self.stages.get(stage)
+
+    def complete(self, stage, artifact):
+        """
+        :param artifact: anything JSON serializable
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.stages[stage] = artifact
+            self._save()
+
+    def get_screenshots(self):
+        """
+        :return: (list) of dicts with 'path', 'hash' and 'source' of the journaled screenshots, or None if there are
+                 none or any of them has been changed or deleted since
+        """
+        screenshots = self.get('screenshots')
+        if not screenshots:
+            return None
+        for screenshot in screenshots:
+            if not os.path.isfile(screenshot['path']) or UploadIndex.hash_file(screenshot['path']) != screenshot['hash']:
+                return None
+        return screenshots
+
+    def complete_screenshots(self, images, image_sources):
+        """
+        :param images: (list) of file paths (str)
+        :param image_sources: (dict) image path -> video file path
+        """
+        if not self.enabled:
+            return
+        self.complete('screenshots', [
+            {'path': image, 'hash': UploadIndex.hash_file(image), 'source': image_sources.get(image)}
+            for image in images
+        ])
+
+    def finish(self):
+        self.stages = {}
+        if os.path.isfile(self.filepath):
+            os.unlink(self.filepath)
+
+    def _load(self):
+        try:
+            with open(self.filepath, 'r', encoding='utf8') as f:
+                journal = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # the release changed on disk, or it is run with other options
+        if journal.get('identity') != self.identity:
+            return {}
+        return journal['stages']
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+        temp_filepath = self.filepath + '.tmp'
+        with open(temp_filepath, 'w', encoding='utf8') as f:
+            json.dump({'identity': self.identity, 'stages': self.stages}, f)
+        os.replace(temp_filepath, self.filepath)
@@ -0,0 +1,106 @@
+import bisect
+import os
+import subprocess
+import threading
+
+import Helper
+from DiskCache import DiskCache
+from LruMemo import LruMemo
+from Profiler import Profiler
+from Settings import Settings
+
+
+class KeyframeIndex:
+    """
+    Per-file list of video keyframe times, in seconds from the start of the file. Built once with an ffprobe
+    packet scan (demuxing only, nothing is decoded) and cached like the mediainfo probes: in memory, and on disk
+    keyed by path, size and mtime
+    """
+    _memo = LruMemo()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_keyframes(file, settings=Settings):
+        """
+        :param file: file path (str)
+        :param settings: Settings, or a Config
+        :return: (list) of sorted keyframe times (float), or None if ffprobe is not available or failed
+        """
+        key = Helper.get_file_key(file)
+
+        with KeyframeIndex._lock:
+            if key in KeyframeIndex._memo:
+                return KeyframeIndex._memo[key]
+        disk_cache = DiskCache.get_shared('keyframes', settings.performance['keyframe_cache_max_bytes'], settings)
+
+        keyframes = disk_cache.get_json(key)
+        if keyframes is None:
+            keyframes = KeyframeIndex._scan_keyframes(file, settings)
+            if keyframes is None:
+                return None
+            disk_cache.put_json(key, keyframes)
+
+        with KeyframeIndex._lock:
+            KeyframeIndex._memo[key] = keyframes
+        return keyframes
+
+    @staticmethod
+    def snap(keyframes, timestamp):
+        """
+        :return: (float) the keyframe time closest to timestamp
+        """
+        i = bisect.bisect_left(keyframes, timestamp)
+        neighbours = keyframes[max(0, i - 1):i + 1]
+        return min(neighbours, key=lambda keyframe: abs(keyframe - timestamp))
+
+    @staticmethod
+    def get_gop_secs(keyframes):
+        """
+        :return: (float) median distance between two keyframes, i.e. the typical GOP length
+        """
+        intervals = sorted(b - a for a, b in zip(keyframes, keyframes[1:]))
+        return intervals[len(intervals) // 2] if intervals else 0.0
+
+    @staticmethod
+    def _scan_keyframes(file, settings):
+        ffprobe_bin_path = KeyframeIndex._get_ffprobe_bin_path(settings)
+        if not os.path.isfile(ffprobe_bin_path):
+            return None
+
+        args = '"{ffprobe_bin_location}" -v error -select_streams v:0 -show_entries packet=pts_time,flags ' \
+               '-of csv=p=0 "{file}"'.format(
+            ffprobe_bin_location=ffprobe_bin_path,
+            file=file
+        )
+        with Profiler.span('ffprobe', 'subprocess', mode='keyframe_scan', path=file) as info:
+            process = subprocess.run(args, shell=True, stdout=subprocess.PIPE)
+            info['bytes_in'] = len(process.stdout)
+        if process.returncode != 0:
+            return None
+
+        packet_times = []
+        keyframes = []
+        for line in process.stdout.decode().splitlines():
+            pts_time, _, flags = line.partition(',')
+            try:
+                pts_time = float(pts_time)
+            except ValueError:
+                continue
+            packet_times.append(pts_time)
+            if 'K' in flags:
+                keyframes.append(pts_time)
+
+        if not keyframes:
+            return None
+        # seeking with -ss is relative to the start of the file, not to the first timestamp of the stream
+        start_time = min(packet_times)
+        return sorted(round(keyframe - start_time, 3) for keyframe in keyframes)
+
+    @staticmethod
+    def _get_ffprobe_bin_path(settings):
+        # ffprobe ships next to ffmpeg; a separate path only has to be set if it doesn't
+        if settings.paths.get('ffprobe_bin_path'):
+            return settings.paths['ffprobe_bin_path']
+        ffmpeg_bin_path = settings.paths['ffmpeg_bin_path']
+        return os.path.join(os.path.dirname(ffmpeg_bin_path),
+                            os.path.basename(ffmpeg_bin_path).replace('ffmpeg', 'ffprobe'))
@@ -0,0 +1,25 @@
+from collections import OrderedDict
+
+# entries kept by default; enough for the files of a large season pack
+DEFAULT_MAX_ENTRIES = 256
+
+
+class LruMemo(OrderedDict):
+    """
+    In-process memo that keeps only its most recently used entries, so a long-running process (the watch mode)
+    doesn't hold on to every file it ever looked at. Not thread-safe on its own; callers keep it behind their lock
+    """
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        super().__init__()
+        self.max_entries = max_entries
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.max_entries:
+            self.popitem(last=False)
@@ -0,0 +1,80 @@
+import json
+import subprocess
+import threading
+
+import Helper
+from ContainerProbe import ContainerProbe
+from DiskCache import DiskCache
+from LruMemo import LruMemo
+from Profiler import Profiler
+from Settings import Settings
+
+
+class MediaProbe:
+    """
+    Single entry point for mediainfo. Outputs of the recently probed files are memoized in the process and all
+    outputs are kept in an on-disk cache keyed by path, size and mtime, so probing a file again costs no mediainfo
+    spawn. Safe to call from several threads at once; every method takes the Settings, or a Config, to use as
+    settings=
+    """
+    _memo = LruMemo()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_text(file, settings=Settings):
+        return MediaProbe._probe(file, '', settings)
+
+    @staticmethod
+    def get_json(file, settings=Settings):
+        return json.loads(MediaProbe._probe(file, '--Output=JSON', settings))
+
+    @staticmethod
+    def get_summary(file, settings=Settings):
+        """
+        Duration, dimensions and aspect ratios only. MKV and MP4 headers are read natively; other containers, or
+        files the native reader can't parse, are handed to mediainfo
+        :param file: file path (str)
+        :return: (dict) mediainfo-style JSON with at least General Duration and Video Width, Height,
+                 PixelAspectRatio and DisplayAspectRatio
+        """
+        key = '{}|summary'.format(Helper.get_file_key(file))
+        with MediaProbe._lock:
+            if key in MediaProbe._memo:
+                return MediaProbe._memo[key]
+
+        with Profiler.span('container_probe', 'probe', path=file) as info:
+            summary = ContainerProbe.read(file)
+            info['native'] = summary is not None
+        if summary is None:
+            summary = MediaProbe.get_json(file, settings)
+
+        with MediaProbe._lock:
+            MediaProbe._memo[key] = summary
+        return summary
+
+    @staticmethod
+    def _probe(file, output_option, settings):
+        key = '{}|{}'.format(Helper.get_file_key(file), output_option)
+
+        with MediaProbe._lock:
+            if key in MediaProbe._memo:
+                return MediaProbe._memo[key]
+        disk_cache = DiskCache.get_shared('probe', settings.performance['probe_cache_max_bytes'], settings)
+
+        output = disk_cache.get(key)
+        if output is not None:
+            output = output.decode()
+        else:
+            args = '"{mediainfo_bin_location}" {output_option} "{file}"'.format(
+                mediainfo_bin_location=settings.paths['mediainfo_bin_path'],
+                output_option=output_option,
+                file=file
+            )
+            with Profiler.span('mediainfo', 'subprocess', path=file, output_option=output_option) as info:
+                output = subprocess.check_output(args, shell=True).decode()
+                info['bytes_in'] = len(output)
+            disk_cache.put(key, output.encode())
+
+        with MediaProbe._lock:
+            MediaProbe._memo[key] = output
+        return output
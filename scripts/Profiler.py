@@ -0,0 +1,73 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+
+class Profiler:
+    """
+    Collects timing spans around subprocess calls, image encodes and HTTP requests, and writes them as a Chrome
+    trace (chrome://tracing, Perfetto) with a per-span-name summary. Disabled unless enable() is called, in which
+    case span() records nothing
+    """
+    enabled = False
+    _events = []
+    _lock = threading.Lock()
+    _origin = time.perf_counter()
+
+    @staticmethod
+    def enable():
+        Profiler.enabled = True
+
+    @staticmethod
+    @contextlib.contextmanager
+    def span(name, category, **args):
+        """
+        Times the enclosed block. The yielded dict is stored as the span's arguments, so callers can add values
+        that are only known afterwards, e.g. info['bytes_in'] = len(output)
+        :param name: (str) e.g. 'ffmpeg', 'mediainfo', 'POST'
+        :param category: (str) e.g. 'subprocess', 'encode', 'http', 'stage'
+        """
+        info = dict(args)
+        if not Profiler.enabled:
+            yield info
+            return
+
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            end = time.perf_counter()
+            event = {
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': round((start - Profiler._origin) * 1e6),
+                'dur': round((end - start) * 1e6),
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'args': info
+            }
+            with Profiler._lock:
+                Profiler._events.append(event)
+
+    @staticmethod
+    def write_trace(file_path):
+        with Profiler._lock:
+            events = list(Profiler._events)
+
+        with open(file_path, 'w', encoding='utf8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms', 'summary': Profiler._summarize(events)}, f)
+
+    @staticmethod
+    def _summarize(events):
+        summary = {}
+        for event in events:
+            key = '{}:{}'.format(event['cat'], event['name'])
+            totals = summary.setdefault(key, {'count': 0, 'total_secs': 0.0, 'bytes_in': 0, 'bytes_out': 0})
+            totals['count'] += 1
+            totals['total_secs'] += event['dur'] / 1e6
+            totals['bytes_in'] += event['args'].get('bytes_in', 0)
+            totals['bytes_out'] += event['args'].get('bytes_out', 0)
+        return summary
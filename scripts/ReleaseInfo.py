@@ -1,49 +1,128 @@
 import os
 import re
-import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-import Helper
-from Settings import Settings
 from DvdAnalyzer import DvdAnalyzer
+from Fingerprint import Fingerprint
+from FingerprintIndex import FingerprintIndex
+from MediaProbe import MediaProbe
+from Settings import Settings
 
 VIDEO_FILE_TYPES = ('.mkv', '.avi', '.mp4', '.ts')
 
 class ReleaseInfo:
     mediainfo_complete_name_re = r'(Complete name *:).+'
 
-    def __init__(self, input_path):
+    def __init__(self, input_path, pack_mode='', settings=Settings):
+        """
+        :param pack_mode: (str) '' keeps only the largest video file of a folder; 'combined' and 'per-episode' treat
+                          every video file of a folder as an episode of a pack, see get_report()
+        :param settings: Settings, or a Config
+        """
         self.input_path = input_path
+        self.pack_mode = pack_mode
+        self.settings = settings
+        self.release_type = ''
+        self.primary_ifo_info = ''
+        self.main_video_files = []
+        self.media_infos = []
+        self.header = ''
+        # identifies the content of the release regardless of its path, see Fingerprint
+        self.fingerprint = ''
+        self._lock = threading.Lock()
+
+    def get_complete_mediainfo(self, journal=None):
+        """
+        Probes the release from scratch on every call; calls from several threads at once run one after another
+        :param journal: (JobJournal) optional; a journaled probe is restored instead of probing again
+        :return: (str) mediainfo of every relevant file
+        """
+        with self._lock:
+            return self._probe(journal)
+
+    def _probe(self, journal):
         self.release_type = ''
         self.primary_ifo_info = ''
         self.main_video_files = []
         self.media_infos = []
+        self.header = ''
+        self.fingerprint = ''
+
+        journaled_probe = journal.get('probe') if journal else None
+        if journaled_probe is not None:
+            self.__dict__.update(journaled_probe)
+            return self.header + ''.join(self.media_infos)
 
-    def get_complete_mediainfo(self):
         relevant_files = self._get_relevant_files()
-        header = ''
-        if self.release_type == 'dvd':
-            header = '[size=4][b]' + os.path.basename(self.input_path) + '[/b][/size]\n\n'
+        if self.release_type in ('dvd', 'pack'):
+            self.header = '[size=4][b]' + os.path.basename(self.input_path) + '[/b][/size]\n\n'
+
+        # a DVD is identified by its IFO and whole main VOB set, a pack by all of its episodes
+        self.fingerprint = Fingerprint.get_release_fingerprint(
+            relevant_files + [file for file in self.main_video_files if file not in relevant_files])
 
-        for file in relevant_files:
+        # the same content seen under another path only needs its complete names replaced
+        mediainfos = FingerprintIndex.get_media_infos(self.fingerprint, self.settings)
+        is_indexed = mediainfos is not None and len(mediainfos) == len(relevant_files)
+        if not is_indexed:
+            # episodes of a pack, and the IFO and VOB of a DVD, are probed concurrently
+            with ThreadPoolExecutor(max_workers=max(1, self.settings.performance['probe_workers'])) as executor:
+                mediainfos = list(executor.map(lambda file: MediaProbe.get_text(file, self.settings), relevant_files))
+
+        media_infos = []
+        for file, mediainfo in zip(relevant_files, mediainfos):
             base_video_name = os.path.basename(file)
 
-            args = '"{mediainfo_bin_location}" "{file}"'.format(
-                mediainfo_bin_location=Settings.paths['mediainfo_bin_path'],
-                file=file
-            )
-            mediainfo = subprocess.check_output(args, shell=True).decode()
             mediainfo = re.sub(ReleaseInfo.mediainfo_complete_name_re, fr'\1 {base_video_name}', mediainfo)
             mediainfo = mediainfo.replace('\r\n', '\n')
 
-            self.media_infos.append(mediainfo.strip() + '\n\n')
+            media_infos.append(mediainfo.strip() + '\n\n')
+        self.media_infos = media_infos
+
+        if not is_indexed:
+            FingerprintIndex.put_media_infos(self.fingerprint, media_infos, self.settings)
 
-        return header + ''.join(self.media_infos)
+        if journal:
+            journal.complete('probe', {
+                'release_type': self.release_type,
+                'primary_ifo_info': self.primary_ifo_info,
+                'main_video_files': self.main_video_files,
+                'media_infos': self.media_infos,
+                'header': self.header,
+                'fingerprint': self.fingerprint
+            })
+        return self.header + ''.join(self.media_infos)
+
+    def get_report(self, image_urls, image_url_lines=None, image_sources=None):
+        """
+        Mediainfo followed by the image urls. Packs in 'per-episode' mode get one section per episode instead: its
+        mediainfo, then the urls of the screenshots taken from it. That needs urls per image, which hosts that
+        return a whole gallery at once (hdbimg) don't provide; those get the combined layout
+        :param image_urls: (str) as returned by ImageUploader.get_image_urls()
+        :param image_url_lines: (list) of (image path, url text) tuples, as returned by
+                                ImageUploader.get_image_url_lines()
+        :param image_sources: (dict) image path -> video file path, as in ScreenshotGenerator.image_sources
+        :return: (str)
+        """
+        combined_report = self.header + ''.join(self.media_infos) + image_urls
+        if self.release_type != 'pack' or self.pack_mode != 'per-episode' or image_url_lines is None or \
+                image_sources is None or \
+                any(image_sources.get(image) not in self.main_video_files for image, _ in image_url_lines):
+            # e.g. a contact sheet of the whole pack, which belongs to no single episode
+            return combined_report
+
+        sections = []
+        for video_file, mediainfo in zip(self.main_video_files, self.media_infos):
+            sections.append(mediainfo + ''.join(url_text for image, url_text in image_url_lines
+                                                if image_sources[image] == video_file))
+        return self.header + '\n'.join(sections)
 
     def _get_relevant_files(self):
         # check if user-set path is of a proper video type
         if os.path.isfile(self.input_path) and self.input_path.endswith(VIDEO_FILE_TYPES):
             self.release_type = 'single'
-            self.main_video_files.append(self.input_path)
+            self.main_video_files = [self.input_path]
             return [self.input_path]
 
         assert os.path.isdir(
@@ -54,16 +133,25 @@ class ReleaseInfo:
         if os.path.isdir(os.path.join(self.input_path, 'VIDEO_TS')):
             self.release_type = 'dvd'
 
-            dvd_info = DvdAnalyzer(self.input_path)
+            dvd_info = DvdAnalyzer(self.input_path, self.settings)
             self.primary_ifo_info = dvd_info.get_primary_ifo_info()
             self.main_video_files = dvd_info.get_main_vob_files()
 
             return [self.primary_ifo_info['path'], self.main_video_files[0]]
         else:
+            # a single pass over the folder yields names and sizes; no extra stat call per file
+            with os.scandir(self.input_path) as entries:
+                video_files = [(entry.path, entry.stat().st_size) for entry in entries
+                               if entry.name.endswith(VIDEO_FILE_TYPES) and entry.is_file()]
+            assert video_files, 'Folder contains no video files of relevant type: ' + ', '.join(VIDEO_FILE_TYPES)
+
+            if self.pack_mode and len(video_files) > 1:
+                self.release_type = 'pack'
+                self.main_video_files = sorted(path for path, _ in video_files)
+                return list(self.main_video_files)
+
             self.release_type = 'single'
-            video_files = [os.path.join(self.input_path, f) for f in os.listdir(self.input_path) if
-                           f.endswith(VIDEO_FILE_TYPES)]
-            largest_filepath = Helper.get_largest_file(video_files)
+            largest_filepath = max(video_files, key=lambda video_file: video_file[1])[0]
             self.main_video_files = [largest_filepath]
 
             return [largest_filepath]
@@ -1,16 +1,17 @@
 #!python3
 
+import argparse
 import os
-import pyperclip
 import subprocess
 import sys
 import time
 
-import Helper
+from BatchScheduler import BatchScheduler
 from Settings import Settings
-from ReleaseInfo import ReleaseInfo
-from ScreenshotGenerator import ScreenshotGenerator
-from ImageUploader import ImageUploader
+from ReleaseProcessor import ReleaseProcessor
+from Profiler import Profiler
+from UploadIndex import UploadIndex
+from WatchDaemon import WatchDaemon
 
 CLEAR_FN = 'cls' if os.name == 'nt' else 'clear'
 
@@ -20,39 +21,115 @@ def main():
         Settings.query_options()
         exit()
 
+    args = _parse_args()
+    if args.profile:
+        Profiler.enable()
+    try:
+        _run(args)
+    finally:
+        if args.profile:
+            Profiler.write_trace(args.profile)
+            print('Profile written to ' + args.profile)
+
+
+def _run(args):
     Settings.load_settings()
+
+    if args.purge_upload_index is not None:
+        max_age_days = args.purge_upload_index if args.purge_upload_index >= 0 else None
+        n_deleted = UploadIndex.purge(max_age_days)
+        print(f'Removed {n_deleted} entries from the upload index')
+        return
+
     Settings.assert_paths()
+    if args.fanout:
+        Settings.performance['upload_fanout'] = args.fanout
 
     image_host_id = Settings.get_preferred_host()
     image_host_name = Settings.image_hosts[image_host_id]['name']
 
-    assert len(sys.argv) > 1, 'Error, need input file'
+    assert len(args.input_paths) > 0, 'Error, need input file'
 
+    if args.watch:
+        print( 'Image host "{}" will be used for uploading\n'.format(image_host_name) )
+        WatchDaemon(args.input_paths, image_host_id, output_dir=args.output_dir, contact_sheet=args.contact_sheet,
+                    pack_mode=args.pack).run()
+        return
+
+    if args.batch or len(args.input_paths) > 1:
+        print( 'Image host "{}" will be used for uploading\n'.format(image_host_name) )
+        failed_paths = BatchScheduler(args.input_paths, image_host_id, output_dir=args.output_dir,
+                                      contact_sheet=args.contact_sheet, pack_mode=args.pack).run()
+        if failed_paths:
+            print('\nFailed releases:\n' + '\n'.join(failed_paths))
+            sys.exit(1)
+        return
+
+    input_path = args.input_paths[0]
     subprocess.run(CLEAR_FN, shell=True)
 
     print( 'Image host "{}" will be used for uploading\n'.format(image_host_name) )
     print('Gathering media info')
-    rls = ReleaseInfo( os.path.abspath(sys.argv[1]) )
-    release_info = rls.get_complete_mediainfo()
+    processor = ReleaseProcessor(Settings, image_host_id, contact_sheet=args.contact_sheet, pack_mode=args.pack)
+    input_path = os.path.abspath(input_path)
+    # a run that failed part way resumes at its first stage that did not complete
+    journal = processor.get_journal(input_path)
+    rls = processor.probe(input_path, journal)
 
-    print('Generating screenshots')
-    screenshot_gen = ScreenshotGenerator()
-    images = screenshot_gen.generate_screenshots(rls)
+    # the same content may have been uploaded before under another path
+    uploaded = processor.get_uploaded(rls, journal)
+    if uploaded is None:
+        print( 'Generating screenshots and uploading them to {}'.format(image_host_name) )
+        uploaded = processor.screenshot_and_upload(rls, journal, name_prefix='')
+        if Settings.performance['upload_fanout']:
+            print('Uploaded to {}'.format(uploaded['image_host_name']))
+        if uploaded['bytes_saved'] > 0:
+            print('Re-encoding saved {:.1f} MB of uploads'.format(uploaded['bytes_saved'] / 1024 / 1024))
 
-    print( 'Uploading images to {}'.format(image_host_name) )
-    gallery_name = Helper.get_gallery_name(sys.argv[1])
-    uploader = ImageUploader(images, gallery_name, image_host_id=image_host_id)
-    uploader.upload()
-    image_urls = uploader.get_image_urls()
+    release_info = rls.get_report(uploaded['image_urls'], uploaded['image_url_lines'], uploaded['image_sources'])
+    journal.finish()
 
     if Settings.print_not_copy:
         subprocess.run(CLEAR_FN, shell=True)
-        print(release_info + image_urls)
+        print(release_info)
     else:
-        pyperclip.copy(release_info + image_urls)
+        import pyperclip
+        pyperclip.copy(release_info)
         print('\nMediainfo + image URLs have been copied to clipboard')
         time.sleep(5)
 
 
+def _parse_args():
+    parser = argparse.ArgumentParser(description='Generates mediainfo and screenshots for a release, uploads the '
+                                                 'screenshots and copies the result to the clipboard')
+    parser.add_argument('input_paths', nargs='*', metavar='input_path',
+                        help='video file or DVD folder; several of them, or folders of releases, in batch mode')
+    parser.add_argument('--batch', action='store_true',
+                        help='process every given release (or every release inside a given folder) and write '
+                             'the results to one text file per release instead of the clipboard')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running and process every new release that appears in the given folders, '
+                             'once it has stopped changing')
+    parser.add_argument('--output-dir', default='',
+                        help='where batch and watch mode write their results; watch mode defaults to next to '
+                             'each release')
+    parser.add_argument('--pack', choices=('combined', 'per-episode'), default='',
+                        help='treat every video file of a folder as an episode: mediainfo of every episode and '
+                             'screenshots spread across them, either in one report or in one section per episode')
+    parser.add_argument('--fanout', choices=('race', 'failover'), default='',
+                        help='upload to several configured image hosts and keep the first complete result: race '
+                             'them all at once, or move on to the next host on errors or after upload_failover_secs '
+                             '(overrides the upload_fanout setting)')
+    parser.add_argument('--contact-sheet', action='store_true',
+                        help='upload a single tiled contact sheet with timestamp labels instead of separate '
+                             'screenshots')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='write timing spans of every subprocess, encode and HTTP request to FILE as a Chrome '
+                             'trace (chrome://tracing, Perfetto) with a per-span summary')
+    parser.add_argument('--purge-upload-index', nargs='?', type=float, const=-1, metavar='DAYS',
+                        help='remove upload index entries older than DAYS (default: the expired ones) and exit')
+    return parser.parse_args()
+
+
 if __name__ == '__main__':
     main()
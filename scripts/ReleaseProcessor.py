@@ -0,0 +1,143 @@
+import os
+import uuid
+
+import Helper
+from FanoutUploader import FanoutUploader
+from FingerprintIndex import FingerprintIndex
+from HostStats import HostStats
+from JobJournal import JobJournal
+from Profiler import Profiler
+from ReleaseInfo import ReleaseInfo
+from ScreenshotGenerator import ScreenshotGenerator
+
+
+class ReleaseProcessor:
+    """
+    Library entry point: runs releases through probe -> screenshots -> upload and returns their reports, without
+    prompts, console clearing or the clipboard. Everything is read from the given settings, so processors with
+    different Configs can run side by side in one process. Every stage can be called from several threads at once,
+    for different releases
+    """
+    def __init__(self, settings, image_host_id, contact_sheet=False, pack_mode=''):
+        """
+        :param settings: Config, or Settings after Settings.load_settings()
+        :param image_host_id: (int) index into settings.image_hosts, e.g. Config.get_image_host_id()
+        """
+        self.settings = settings
+        self.image_host_id = image_host_id
+        self.contact_sheet = contact_sheet
+        self.pack_mode = pack_mode
+
+    def process(self, input_path, name_prefix=None):
+        """
+        :param input_path: video file, DVD folder, or folder of episodes in pack mode (str)
+        :param name_prefix: (str) prepended to the screenshot file names; by default the release name and a random
+                            suffix, so calls running at the same time never write the same files
+        :return: (str) mediainfo and image URLs of the release
+        """
+        input_path = os.path.abspath(input_path)
+        journal = self.get_journal(input_path)
+        rls = self.probe(input_path, journal)
+        uploaded = self.get_uploaded(rls, journal)
+        if uploaded is None:
+            uploaded = self.screenshot_and_upload(rls, journal, name_prefix)
+
+        release_info = rls.get_report(uploaded['image_urls'], uploaded['image_url_lines'], uploaded['image_sources'])
+        journal.finish()
+        return release_info
+
+    def get_journal(self, input_path):
+        """
+        :return: (JobJournal) of the release; a run that failed part way resumes at its first stage that did not
+                 complete
+        """
+        return JobJournal(input_path, self.get_options(), self.settings)
+
+    def get_options(self):
+        """
+        :return: (dict) the options that decide the results of a release; the journal and the fingerprint index
+                 keep pre-formatted url text, so everything that changes its format or its image host is included
+        """
+        return {
+            'image_host_id': self.image_host_id,
+            'contact_sheet': self.contact_sheet,
+            'pack_mode': self.pack_mode,
+            'use_bbcode_tags': bool(self.settings.use_bbcode_tags),
+            'upload_fanout': self.settings.performance['upload_fanout'],
+            # a list, as it comes back from the journal's json
+            'upload_hosts': list(self.settings.performance['upload_hosts'])
+        }
+
+    def probe(self, input_path, journal=None):
+        """
+        :return: (ReleaseInfo) with its mediainfo gathered
+        """
+        with Profiler.span('probe', 'stage', path=input_path):
+            rls = ReleaseInfo(input_path, pack_mode=self.pack_mode, settings=self.settings)
+            rls.get_complete_mediainfo(journal)
+            return rls
+
+    def get_uploaded(self, rls, journal=None):
+        """
+        :return: (dict) the journaled upload, or the upload of the same content under another path; None if there
+                 is neither
+        """
+        return (journal.get('upload') if journal else None) or \
+            FingerprintIndex.get_uploaded(rls, self.get_options(), self.settings)
+
+    def take_screenshots(self, rls, journal=None, name_prefix=None):
+        """
+        :return: (tuple) list of image paths, and the source file of each image
+        """
+        with Profiler.span('screenshots', 'stage', path=rls.input_path):
+            screenshot_gen = self._create_screenshot_generator(rls, name_prefix)
+            return screenshot_gen.generate_screenshots(rls, journal), screenshot_gen.image_sources
+
+    def upload(self, rls, images, image_sources, journal=None):
+        """
+        :return: (dict) 'image_urls', 'image_url_lines' and 'image_sources', as taken by ReleaseInfo.get_report()
+        """
+        uploader = self._create_uploader(rls)
+        try:
+            with Profiler.span('upload', 'stage', path=rls.input_path):
+                uploader.upload_stream(images)
+        finally:
+            # failed requests count as much for the ranking as successful ones
+            HostStats.save(self.settings)
+        return self._store_uploaded(rls, uploader, image_sources, journal)
+
+    def screenshot_and_upload(self, rls, journal=None, name_prefix=None):
+        """
+        Uploads every screenshot as soon as it is written, while the next ones are still being extracted
+        :return: (dict) as upload()
+        """
+        screenshot_gen = self._create_screenshot_generator(rls, name_prefix)
+        uploader = self._create_uploader(rls)
+        try:
+            with Profiler.span('screenshots_and_upload', 'stage', path=rls.input_path):
+                uploader.upload_stream(screenshot_gen.iter_screenshots(rls, journal))
+        finally:
+            HostStats.save(self.settings)
+        return self._store_uploaded(rls, uploader, screenshot_gen.image_sources, journal)
+
+    def _create_screenshot_generator(self, rls, name_prefix):
+        if name_prefix is None:
+            # the file names of ScreenshotGenerator only change once a second
+            name_prefix = f'{os.path.basename(rls.input_path)} {uuid.uuid4().hex[:8]} '
+        return ScreenshotGenerator(name_prefix=name_prefix, contact_sheet=self.contact_sheet, settings=self.settings)
+
+    def _create_uploader(self, rls):
+        return FanoutUploader.create([], Helper.get_gallery_name(rls.input_path), image_host_id=self.image_host_id,
+                                     settings=self.settings)
+
+    def _store_uploaded(self, rls, uploader, image_sources, journal):
+        uploaded = {
+            'image_urls': uploader.get_image_urls(),
+            'image_url_lines': uploader.get_image_url_lines(),
+            'image_sources': image_sources
+        }
+        if journal:
+            journal.complete('upload', uploaded)
+        FingerprintIndex.put_uploaded(rls, self.get_options(), uploaded, self.settings)
+        # only for the caller; not part of the journaled or indexed upload
+        return {**uploaded, 'image_host_name': uploader.image_host['name'], 'bytes_saved': uploader.get_bytes_saved()}
@@ -1,63 +1,463 @@
 import datetime
-import json
 import os
 import subprocess
-from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
 
+import Helper
+from DiskCache import DiskCache
+from KeyframeIndex import KeyframeIndex
+from MediaProbe import MediaProbe
+from Profiler import Profiler
 from Settings import Settings
+from TimelineAnalyzer import TimelineAnalyzer, BLACK_FRAME_MAX_LUMA, FLAT_FRAME_MAX_STDDEV
 
 
 class ScreenshotGenerator:
-    def __init__(self, n_images=6):
+    """
+    Takes the screenshots of one release at a time. Generators for different releases can run in parallel threads;
+    screenshots with the same name_prefix in the same image save directory would overwrite each other
+    """
+    def __init__(self, n_images=6, name_prefix='', contact_sheet=False, settings=Settings):
+        """
+        :param settings: Settings, or a Config
+        """
         self.n_images = n_images
+        self.settings = settings
+        # keeps the file names of releases that are processed at the same time apart
+        self.name_prefix = name_prefix
+        # one tiled image of contact_sheet_frames frames instead of n_images separate screenshots
+        self.contact_sheet = contact_sheet
         self.display_width = 0
         self.display_height = 0
-        self.param_DAR = ''
+        self.now = ''
+        # per video file: seconds the scene filter may decode forward before it has to take a frame
+        self.scene_search_secs = {}
+        # per video file: TimelineAnalyzer timeline, if timeline_analysis is on
+        self.timelines = {}
+        # screenshot path -> video file it was taken from; 'contact sheet' for a contact sheet of several files
+        self.image_sources = {}
+
+    def generate_screenshots(self, rls, journal=None):
+        return list(self.iter_screenshots(rls, journal))
+
+    def iter_screenshots(self, rls, journal=None):
+        """
+        Yields the file path of every kept screenshot as soon as it has been written, in snapshot order, so
+        consumers (e.g. ImageUploader.upload_stream) can start working while later screenshots are still extracted
+        :param journal: (JobJournal) optional; journaled screenshots are handed back as they are, and journaled
+                        timestamps skip the candidate search
+        :return: generator of file paths (str)
+        """
+        journaled_screenshots = journal.get_screenshots() if journal else None
+        if journaled_screenshots is not None:
+            for screenshot in journaled_screenshots:
+                self.image_sources[screenshot['path']] = screenshot['source']
+                yield screenshot['path']
+            return
+
+        images = []
+        for image in self._iter_new_screenshots(rls, journal):
+            images.append(image)
+            yield image
 
-    def generate_screenshots(self, rls):
-        saved_images = []
-        timestamp_data = self._get_timestamp_data(rls)
+        if journal:
+            journal.complete_screenshots(images, self.image_sources)
 
+    def _iter_new_screenshots(self, rls, journal):
         self.display_width, self.display_height = self._get_display_dimensions(rls)
-        self.param_DAR = f'-vf "scale={self.display_width}:{self.display_height}"'
+        self.now = datetime.datetime.now().strftime('%Y-%m-%d %H-%M-%S')
+
+        if self.contact_sheet:
+            yield self._build_contact_sheet(rls)
+            return
+
+        n_workers = max(1, self.settings.performance['extraction_workers'])
+        candidate_multiplier = max(1, self.settings.performance['candidate_multiplier'])
+
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            journaled_timestamps = journal.get('timestamps') if journal else None
+            if journaled_timestamps is not None:
+                timestamp_data = journaled_timestamps['timestamp_data']
+                self.scene_search_secs = journaled_timestamps['scene_search_secs']
+            else:
+                # timestamps placed on the analyzed timelines are final; nothing has to be decoded to score them
+                if self._load_timelines(rls):
+                    candidate_multiplier = 1
+                timestamp_data = self._get_timestamp_data(rls, self.n_images, candidate_multiplier)
+                if candidate_multiplier > 1:
+                    timestamp_data = self._select_best_candidates(timestamp_data, executor, n_workers)
+                if journal:
+                    journal.complete('timestamps', {'timestamp_data': timestamp_data,
+                                                    'scene_search_secs': self.scene_search_secs})
+
+            # results are handed back in submission order, which keeps the snapshot numbering deterministic
+            jobs = self._get_extraction_jobs(timestamp_data, n_workers)
+            futures = [executor.submit(self._run_extraction_job, job) for job in jobs]
+            for future in futures:
+                yield from future.result()
+
+    def _select_best_candidates(self, timestamp_data, executor, n_workers):
+        """
+        Decodes every candidate timestamp at low resolution straight into memory, scores it and keeps the
+        n_images best, so full display resolution is only ever decoded for frames that are actually kept. Episodes
+        of a pack keep their own share of the best ones
+        :param timestamp_data: (list) of dicts as returned by _get_timestamp_data()
+        :return: (list) of dicts in the same format, holding n_images timestamps in chronological order
+        """
+        jobs = self._get_extraction_jobs(timestamp_data, n_workers)
+        scores = [score for job_scores in executor.map(self._score_candidates, jobs) for score in job_scores]
+        candidates = [(data['path'], timestamp) for data in timestamp_data for timestamp in data['timestamps']]
+
+        # (candidate indexes, number of them to keep)
+        groups = [(range(len(candidates)), self.n_images)]
+        if all('n_keep' in data for data in timestamp_data):
+            groups = []
+            for data in timestamp_data:
+                first = groups[-1][0].stop if groups else 0
+                groups.append((range(first, first + len(data['timestamps'])), data['n_keep']))
+
+        best = [i for indexes, n_keep in groups
+                for i in sorted(indexes, key=lambda i: scores[i], reverse=True)[:n_keep]]
+
+        best_timestamp_data = []
+        for i in sorted(best):
+            path, timestamp = candidates[i]
+            if not best_timestamp_data or best_timestamp_data[-1]['path'] != path:
+                best_timestamp_data.append({'path': path, 'timestamps': []})
+            best_timestamp_data[-1]['timestamps'].append(timestamp)
+
+        return best_timestamp_data
+
+    def _score_candidates(self, job):
+        width = self.settings.performance['candidate_width']
+        # scaled dimensions have to stay even for ffmpeg's scaler
+        height = max(2, round(width * self.display_height / self.display_width / 2) * 2)
+
+        frames = None
+        if len(job['timestamps']) > 1:
+            frames = self._read_frames_single_pass(job['path'], job['timestamps'], width, height)
+        if frames is None:
+            frames = [self._read_frame(job['path'], timestamp, width, height) for timestamp in job['timestamps']]
+
+        with Profiler.span('score_candidates', 'compute', n_frames=len(frames)):
+            return [self._score_frame(frame) if frame is not None else -1.0 for frame in frames]
+
+    def _score_frame(self, luma):
+        """
+        Scores the amount of detail in a grayscale frame as log(Laplacian variance) * luma entropy. Black and flat
+        frames score below every real frame
+        :param luma: (numpy.ndarray) 2d uint8 array
+        :return: (float)
+        """
+        import numpy as np
+
+        luma_float = luma.astype(np.float32)
+        if luma_float.mean() < BLACK_FRAME_MAX_LUMA or luma_float.std() < FLAT_FRAME_MAX_STDDEV:
+            return -1.0
+
+        laplacian = 4 * luma_float[1:-1, 1:-1] - luma_float[:-2, 1:-1] - luma_float[2:, 1:-1] \
+            - luma_float[1:-1, :-2] - luma_float[1:-1, 2:]
 
+        histogram = np.bincount(luma.ravel(), minlength=256) / luma.size
+        histogram = histogram[histogram > 0]
+        entropy = -np.sum(histogram * np.log2(histogram))
+
+        return float(np.log1p(laplacian.var()) * entropy)
+
+    def _get_extraction_jobs(self, timestamp_data, n_workers):
+        """
+        Splits all timestamps into independent extraction jobs. Snapshot numbers are fixed here, before any job
+        runs, so the snapshot_{n} numbering does not depend on the order in which jobs finish
+        :param timestamp_data: (list) of dicts as returned by _get_timestamp_data()
+        :param n_workers: (int) number of jobs that will run concurrently
+        :return: (list) of dicts
+        """
+        jobs = []
         temp_num = 0
+        # in single-pass mode a file's timestamps are spread over enough processes to keep every worker busy
+        groups_per_file = -(-n_workers // len(timestamp_data)) if timestamp_data else 1
+
         for data in timestamp_data:
-            video_filepath = data['path']
-            for timestamp in data['timestamps']:
-                now = datetime.datetime.now().strftime('%Y-%m-%d %H-%M-%S')
-                output_file = f'snapshot_{temp_num} {now}'
-                output_filepath = os.path.join(Settings.paths['image_save_location'], output_file)
-
-                args = r'"{ffmpeg_bin_location}" -hide_banner -loglevel panic -ss {timestamp} -i "{video_filepath}" ' \
-                       r'-vf "select=gt(scene\,0.01)" {param_DAR} -r 1 -frames:v 1 "{output_filepath}.png"'.format(
-                    ffmpeg_bin_location=Settings.paths['ffmpeg_bin_path'],
-                    timestamp=timestamp,
-                    video_filepath=video_filepath,
-                    param_DAR=self.param_DAR,
-                    output_filepath=output_filepath
+            timestamps = data['timestamps']
+
+            group_size = 1
+            if self.settings.performance['single_pass_extraction']:
+                group_size = -(-len(timestamps) // min(groups_per_file, len(timestamps)))
+
+            for i in range(0, len(timestamps), group_size):
+                jobs.append({
+                    'path': data['path'],
+                    'timestamps': timestamps[i:i + group_size],
+                    'first_num': temp_num + i
+                })
+            temp_num += len(timestamps)
+
+        return jobs
+
+    def _run_extraction_job(self, job):
+        video_filepath = job['path']
+        output_filepaths = [
+            os.path.join(self.settings.paths['image_save_location'],
+                         f'{self.name_prefix}snapshot_{job["first_num"] + i} {self.now}')
+            for i, _ in enumerate(job['timestamps'])
+        ]
+
+        # frames extracted by an earlier run are copied out of the screenshot cache; only the rest goes to ffmpeg
+        cache_keys = [self._get_screenshot_cache_key(video_filepath, timestamp) for timestamp in job['timestamps']]
+        missing = [i for i, (cache_key, output_filepath) in enumerate(zip(cache_keys, output_filepaths))
+                   if not self._restore_cached_screenshot(cache_key, f'{output_filepath}.png')]
+        timestamps = [job['timestamps'][i] for i in missing]
+        missing_filepaths = [output_filepaths[i] for i in missing]
+
+        if len(timestamps) == 1 or \
+                (timestamps and not self._extract_frames_single_pass(video_filepath, timestamps, missing_filepaths)):
+            for timestamp, output_filepath in zip(timestamps, missing_filepaths):
+                self._extract_frame(video_filepath, timestamp, output_filepath)
+
+        for i in missing:
+            if os.path.isfile(f'{output_filepaths[i]}.png'):
+                with open(f'{output_filepaths[i]}.png', 'rb') as f:
+                    self._get_screenshot_cache().put(cache_keys[i], f.read())
+
+        images = [f'{output_filepath}.png' for output_filepath in output_filepaths
+                  if os.path.isfile(f'{output_filepath}.png')]
+        for image in images:
+            self.image_sources[image] = video_filepath
+        return images
+
+    def _get_screenshot_cache_key(self, video_filepath, timestamp):
+        return '{}|{}|{}x{}|{}'.format(Helper.get_file_key(video_filepath), timestamp, self.display_width,
+                                       self.display_height, self.scene_search_secs.get(video_filepath))
+
+    def _restore_cached_screenshot(self, cache_key, image):
+        """
+        :return: (bool) True if the screenshot was in the cache and has been written to image
+        """
+        data = self._get_screenshot_cache().get(cache_key)
+        if data is None:
+            return False
+        with open(image, 'wb') as f:
+            f.write(data)
+        return True
+
+    def _get_screenshot_cache(self):
+        return DiskCache.get_shared('screenshots', self.settings.performance['screenshot_cache_max_bytes'],
+                                    self.settings)
+
+    def _read_frame(self, video_filepath, timestamp, width, height):
+        args = '"{ffmpeg_bin_location}" -hide_banner -loglevel panic -ss {timestamp} -i "{video_filepath}" ' \
+               '-vf "{frame_filter}" -frames:v 1 -f rawvideo -pix_fmt gray pipe:1'.format(
+            ffmpeg_bin_location=self.settings.paths['ffmpeg_bin_path'],
+            timestamp=timestamp,
+            video_filepath=video_filepath,
+            frame_filter=self._get_frame_filter(video_filepath, width, height)
+        )
+        with Profiler.span('ffmpeg', 'subprocess', mode='read_frame', path=video_filepath) as info:
+            raw_video = subprocess.run(args, shell=True, stdout=subprocess.PIPE).stdout
+            info['bytes_in'] = len(raw_video)
+        frames = self._split_raw_frames(raw_video, width, height, 1)
+        return frames[0] if frames else None
+
+    def _read_frames_single_pass(self, video_filepath, timestamps, width, height):
+        """
+        In-memory counterpart of _extract_frames_single_pass(): every seeked input is trimmed to its first selected
+        frame, and those frames are stacked vertically into a single raw grayscale picture on stdout. Stacking lets
+        ffmpeg stop after one output frame, whereas concat would keep decoding the queued inputs
+        :return: (list) of numpy arrays, or None if ffmpeg did not deliver every frame
+        """
+        inputs = ''
+        filter_graph = []
+        for i, timestamp in enumerate(timestamps):
+            inputs += f'-ss {timestamp} -i "{video_filepath}" '
+            filter_graph.append(f'[{i}:v]{self._get_frame_filter(video_filepath, width, height)},setsar=1,'
+                                f'trim=end_frame=1,'
+                                f'setpts=PTS-STARTPTS[v{i}]')
+        filter_graph.append(''.join(f'[v{i}]' for i in range(len(timestamps))) +
+                            f'vstack=inputs={len(timestamps)}[out]')
+
+        args = '"{ffmpeg_bin_location}" -hide_banner -loglevel panic {inputs}-filter_complex "{filter_graph}" ' \
+               '-map "[out]" -frames:v 1 -f rawvideo -pix_fmt gray pipe:1'.format(
+            ffmpeg_bin_location=self.settings.paths['ffmpeg_bin_path'],
+            inputs=inputs,
+            filter_graph=';'.join(filter_graph)
+        )
+        with Profiler.span('ffmpeg', 'subprocess', mode='read_frames_single_pass', path=video_filepath,
+                           n_frames=len(timestamps)) as info:
+            process = subprocess.run(args, shell=True, stdout=subprocess.PIPE)
+            info['bytes_in'] = len(process.stdout)
+        frames = self._split_raw_frames(process.stdout, width, height, len(timestamps))
+
+        if process.returncode != 0 or len(frames) != len(timestamps):
+            return None
+        return frames
+
+    def _split_raw_frames(self, raw_video, width, height, max_frames):
+        import numpy as np
+
+        frame_size = width * height
+        n_frames = min(len(raw_video) // frame_size, max_frames)
+        return [np.frombuffer(raw_video, dtype=np.uint8, count=frame_size, offset=i * frame_size).reshape(height, width)
+                for i in range(n_frames)]
+
+    def _get_frame_filter(self, video_filepath, width=None, height=None):
+        width = width or self.display_width
+        height = height or self.display_height
+
+        select_expr = r'gt(scene\,0.01)'
+        # bounds the forward decode on static shots; t restarts at 0 at the seek point
+        if self.scene_search_secs.get(video_filepath):
+            select_expr += r'+gte(t\,{})'.format(self.scene_search_secs[video_filepath])
+        return f'select={select_expr},scale={width}:{height}'
+
+    def _extract_frame(self, video_filepath, timestamp, output_filepath):
+        # the same filter as the single-pass extraction, so the frame that was scored is the one that is written
+        args = '"{ffmpeg_bin_location}" -hide_banner -loglevel panic -ss {timestamp} -i "{video_filepath}" ' \
+               '-vf "{frame_filter}" -r 1 -frames:v 1 "{output_filepath}.png"'.format(
+            ffmpeg_bin_location=self.settings.paths['ffmpeg_bin_path'],
+            timestamp=timestamp,
+            video_filepath=video_filepath,
+            frame_filter=self._get_frame_filter(video_filepath),
+            output_filepath=output_filepath
+        )
+        with Profiler.span('ffmpeg', 'subprocess', mode='extract_frame', path=video_filepath) as info:
+            subprocess.run(args, shell=True)
+            info['bytes_out'] = self._get_file_size(f'{output_filepath}.png')
+
+    def _extract_frames_single_pass(self, video_filepath, timestamps, output_filepaths):
+        """
+        Extracts all timestamps of a file with a single ffmpeg process: the file is opened once per timestamp as a
+        separately seeked input, so container probing and process startup are only paid once
+        :param video_filepath: (str)
+        :param timestamps: (list) of seconds (int)
+        :param output_filepaths: (list) of file paths (str) without extension, one per timestamp
+        :return: (bool) True if every frame was written
+        """
+        inputs = ''
+        filter_graph = []
+        outputs = ''
+        for i, (timestamp, output_filepath) in enumerate(zip(timestamps, output_filepaths)):
+            inputs += f'-ss {timestamp} -i "{video_filepath}" '
+            filter_graph.append(f'[{i}:v]{self._get_frame_filter(video_filepath)}[v{i}]')
+            outputs += f'-map "[v{i}]" -r 1 -frames:v 1 "{output_filepath}.png" '
+
+        args = '"{ffmpeg_bin_location}" -hide_banner -loglevel panic {inputs}-filter_complex "{filter_graph}" ' \
+               '{outputs}'.format(
+            ffmpeg_bin_location=self.settings.paths['ffmpeg_bin_path'],
+            inputs=inputs,
+            filter_graph=';'.join(filter_graph),
+            outputs=outputs.strip()
+        )
+        with Profiler.span('ffmpeg', 'subprocess', mode='extract_frames_single_pass', path=video_filepath,
+                           n_frames=len(timestamps)) as info:
+            process = subprocess.run(args, shell=True)
+            info['bytes_out'] = sum(self._get_file_size(f'{f}.png') for f in output_filepaths)
+
+        if process.returncode == 0 and all(os.path.isfile(f'{f}.png') for f in output_filepaths):
+            return True
+
+        # leave no partial output behind for the per-timestamp fallback
+        for output_filepath in output_filepaths:
+            if os.path.isfile(f'{output_filepath}.png'):
+                os.unlink(f'{output_filepath}.png')
+        return False
+
+    def _build_contact_sheet(self, rls):
+        """
+        Builds a grid of contact_sheet_frames frames with a single ffmpeg process: every timestamp is a separately
+        seeked input, trimmed to its first selected frame, scaled to tile size and placed with xstack
+        :return: (str) file path of the contact sheet
+        """
+        n_frames = max(1, self.settings.performance['contact_sheet_frames'])
+        n_columns = max(1, min(self.settings.performance['contact_sheet_columns'], n_frames))
+        tile_width = self.settings.performance['contact_sheet_tile_width']
+        # scaled dimensions have to stay even for ffmpeg's scaler
+        tile_height = max(2, round(tile_width * self.display_height / self.display_width / 2) * 2)
+
+        tiles = [(data['path'], timestamp) for data in self._get_timestamp_data(rls, n_frames, 1)
+                 for timestamp in data['timestamps']]
+        output_filepath = os.path.join(self.settings.paths['image_save_location'],
+                                       f'{self.name_prefix}contact_sheet {self.now}.png')
+
+        with_labels = self.settings.performance['contact_sheet_labels']
+        if (not self._extract_contact_sheet(tiles, n_columns, tile_width, tile_height, output_filepath, with_labels)
+                and with_labels):
+            # drawtext is only available in ffmpeg builds with libfreetype
+            print('Warning: ffmpeg could not draw the contact sheet labels, retrying without them')
+            self._extract_contact_sheet(tiles, n_columns, tile_width, tile_height, output_filepath, False)
+
+        assert os.path.isfile(output_filepath), 'Error: ffmpeg could not create the contact sheet'
+        # a sheet of several files (packs, multi-file DVDs) has no single source
+        tile_sources = set(video_filepath for video_filepath, _ in tiles)
+        self.image_sources[output_filepath] = tile_sources.pop() if len(tile_sources) == 1 else 'contact sheet'
+        return output_filepath
+
+    def _extract_contact_sheet(self, tiles, n_columns, tile_width, tile_height, output_filepath, with_labels):
+        """
+        :param tiles: (list) of (video file path, timestamp) tuples, in grid order
+        :return: (bool) True if the contact sheet was written
+        """
+        inputs = ''
+        filter_graph = []
+        for i, (video_filepath, timestamp) in enumerate(tiles):
+            inputs += f'-ss {timestamp} -i "{video_filepath}" '
+            tile_filter = f'[{i}:v]{self._get_frame_filter(video_filepath, tile_width, tile_height)},setsar=1,' \
+                          f'trim=end_frame=1,setpts=PTS-STARTPTS'
+            if with_labels:
+                tile_filter += r",drawtext=text='{label}':x=8:y=h-th-8:fontsize={font_size}:fontcolor=white:" \
+                               r'box=1:boxcolor=black@0.6:boxborderw=4'.format(
+                    label=self._format_timestamp(timestamp).replace(':', r'\:'),
+                    font_size=max(10, tile_height // 12)
                 )
-                subprocess.run(args, shell=True)
-                temp_num += 1
+            filter_graph.append(f'{tile_filter}[v{i}]')
 
-                picture = Image.open(f'{output_filepath}.png')
-                picture.save(f'{output_filepath}.jpg', optimize=True, quality=15)
+        if len(tiles) > 1:
+            layout = '|'.join(f'{i % n_columns * tile_width}_{i // n_columns * tile_height}' for i in range(len(tiles)))
+            filter_graph.append(''.join(f'[v{i}]' for i in range(len(tiles))) +
+                                f'xstack=inputs={len(tiles)}:layout={layout}:fill=black[out]')
+        else:
+            filter_graph.append('[v0]null[out]')
 
-                compressed_size = os.path.getsize(f'{output_filepath}.jpg')
-                saved_images.append({'path': output_filepath, 'size': compressed_size})
+        args = '"{ffmpeg_bin_location}" -hide_banner -loglevel panic {inputs}-filter_complex "{filter_graph}" ' \
+               '-map "[out]" -frames:v 1 -y "{output_filepath}"'.format(
+            ffmpeg_bin_location=self.settings.paths['ffmpeg_bin_path'],
+            inputs=inputs,
+            filter_graph=';'.join(filter_graph),
+            output_filepath=output_filepath
+        )
+        with Profiler.span('ffmpeg', 'subprocess', mode='contact_sheet', n_frames=len(tiles)) as info:
+            process = subprocess.run(args, shell=True)
+            info['bytes_out'] = self._get_file_size(output_filepath)
 
-        return self._keep_n_largest(saved_images)
+        if process.returncode == 0 and os.path.isfile(output_filepath):
+            return True
+        if os.path.isfile(output_filepath):
+            os.unlink(output_filepath)
+        return False
 
-    def _get_timestamp_data(self, rls):
+    def _format_timestamp(self, timestamp):
+        secs = int(timestamp)
+        return '{:02d}:{:02d}:{:02d}'.format(secs // 3600, secs // 60 % 60, secs % 60)
+
+    def _get_timestamp_data(self, rls, n_images, candidate_multiplier):
+        """
+        :param n_images: (int) number of screenshots that are kept
+        :param candidate_multiplier: (int) timestamps per kept screenshot
+        :return: (list) of dicts with a video file 'path' and its 'timestamps'; for packs also 'n_keep', the
+                 number of screenshots kept from that episode
+        """
         main_files_data = self._get_runtime_data(rls)
+        if rls.release_type == 'pack':
+            return self._get_pack_timestamp_data(main_files_data, n_images, candidate_multiplier)
+
+        n_timestamps = n_images * candidate_multiplier
         timestamp_data = []
 
         min_timestamp_secs = int(main_files_data['total_runtime'] * 0.05)
         max_timestamp_secs = int(main_files_data['total_runtime'] * 0.6)
-        increase_interval_secs = (max_timestamp_secs - min_timestamp_secs) // self.n_images
+        increase_interval_secs = max(1, (max_timestamp_secs - min_timestamp_secs) // n_timestamps)
 
         timestamp = min_timestamp_secs
-        num_remaining = self.n_images
+        num_remaining = n_timestamps
         for filedata in main_files_data['runtime_data']:
             timestamps = []
             while num_remaining > 0 and timestamp < filedata['runtime']:
@@ -68,23 +468,110 @@ class ScreenshotGenerator:
             if timestamp > filedata['runtime']:
                 timestamp -= int(filedata['runtime'] - 1)
             if timestamps:
+                timestamps = self._snap_to_keyframes(filedata['path'], timestamps)
+                timestamps = self._place_on_timeline(filedata['path'], timestamps, increase_interval_secs)
                 timestamp_data.append({'path': filedata['path'], 'timestamps': timestamps})
 
         return timestamp_data
 
+    def _get_pack_timestamp_data(self, main_files_data, n_images, candidate_multiplier):
+        """
+        Spreads the screenshots over the episodes of a pack: with fewer screenshots than episodes every one comes
+        from a different, evenly spaced episode, otherwise every episode gets an even share. pack_images_per_episode
+        overrides this with a fixed number per episode. Timestamps are spread over 5-60% of each episode's runtime
+        """
+        runtime_data = main_files_data['runtime_data']
+        images_per_episode = [self.settings.performance['pack_images_per_episode']] * len(runtime_data)
+        if self.settings.performance['pack_images_per_episode'] <= 0:
+            images_per_episode = [0] * len(runtime_data)
+            for i in range(n_images):
+                images_per_episode[i * len(runtime_data) // n_images] += 1
+
+        timestamp_data = []
+        for filedata, n_keep in zip(runtime_data, images_per_episode):
+            if n_keep == 0:
+                continue
+            n_timestamps = n_keep * candidate_multiplier
+            min_timestamp_secs = int(filedata['runtime'] * 0.05)
+            max_timestamp_secs = int(filedata['runtime'] * 0.6)
+            increase_interval_secs = max(1, (max_timestamp_secs - min_timestamp_secs) // n_timestamps)
+
+            timestamps = [timestamp for timestamp in
+                          range(min_timestamp_secs, min_timestamp_secs + n_timestamps * increase_interval_secs,
+                                increase_interval_secs)
+                          if timestamp < filedata['runtime']]
+            if timestamps:
+                timestamps = self._snap_to_keyframes(filedata['path'], timestamps)
+                timestamps = self._place_on_timeline(filedata['path'], timestamps, increase_interval_secs)
+                timestamp_data.append({'path': filedata['path'], 'timestamps': timestamps, 'n_keep': n_keep})
+
+        return timestamp_data
+
+    def _snap_to_keyframes(self, video_filepath, timestamps):
+        """
+        Moves every timestamp onto its closest keyframe, so seeking lands exactly on a decodable frame, and bounds
+        the scene filter's forward search to one GOP of the file
+        :return: (list) of timestamps (float or int); unchanged if the file has no keyframe index
+        """
+        if not self.settings.performance['keyframe_index']:
+            return timestamps
+        keyframes = KeyframeIndex.get_keyframes(video_filepath, self.settings)
+        if not keyframes:
+            return timestamps
+
+        self.scene_search_secs[video_filepath] = KeyframeIndex.get_gop_secs(keyframes)
+
+        snapped_timestamps = []
+        for timestamp in timestamps:
+            snapped = KeyframeIndex.snap(keyframes, timestamp)
+            # two targets within one GOP would otherwise give the same frame twice
+            snapped_timestamps.append(timestamp if snapped_timestamps and snapped == snapped_timestamps[-1]
+                                      else snapped)
+        return snapped_timestamps
+
+    def _load_timelines(self, rls):
+        """
+        Analyzes every main video file that has no cached timeline yet
+        :return: (bool) True if there is a timeline for every main video file
+        """
+        if not self.settings.performance['timeline_analysis'] or not self.settings.performance['keyframe_index']:
+            return False
+
+        with ThreadPoolExecutor(max_workers=max(1, self.settings.performance['probe_workers'])) as executor:
+            timelines = list(executor.map(lambda file: TimelineAnalyzer.get_timeline(file, self.settings),
+                                          rls.main_video_files))
+        self.timelines = {path: timeline for path, timeline in zip(rls.main_video_files, timelines)
+                          if timeline is not None}
+        return len(self.timelines) == len(rls.main_video_files)
+
+    def _place_on_timeline(self, video_filepath, timestamps, interval_secs):
+        """
+        Moves every timestamp to the best keyframe of its own stretch of the timeline (half an interval either
+        side), skipping black frames and fades; timestamps with no usable keyframe around them stay where they are
+        :param interval_secs: distance between two neighbouring timestamps
+        :return: (list) of timestamps
+        """
+        timeline = self.timelines.get(video_filepath)
+        if timeline is None:
+            return timestamps
+
+        placed_timestamps = []
+        for timestamp in timestamps:
+            placed = TimelineAnalyzer.pick(timeline, timestamp - interval_secs / 2, timestamp + interval_secs / 2)
+            placed_timestamps.append(timestamp if placed is None or placed in placed_timestamps else placed)
+        return placed_timestamps
+
     def _get_runtime_data(self, rls):
         main_files_data = {
             'total_runtime': 0,
             'runtime_data': []
         }
 
-        for video_filepath in rls.main_video_files:
-            args = '"{mediainfo_bin_location}" --Output=JSON "{video_filepath}"'.format(
-                mediainfo_bin_location=Settings.paths['mediainfo_bin_path'],
-                video_filepath=video_filepath
-            )
-            mediainfo_json = subprocess.check_output(args, shell=True).decode()
-            mediainfo_json = json.loads(mediainfo_json)
+        with ThreadPoolExecutor(max_workers=max(1, self.settings.performance['probe_workers'])) as executor:
+            mediainfo_jsons = list(executor.map(lambda file: MediaProbe.get_summary(file, self.settings),
+                                                rls.main_video_files))
+
+        for video_filepath, mediainfo_json in zip(rls.main_video_files, mediainfo_jsons):
             total_runtime_secs = float(mediainfo_json['media']['track'][0]['Duration'])
 
             main_files_data['total_runtime'] += total_runtime_secs
@@ -98,12 +585,7 @@ class ScreenshotGenerator:
         if rls.release_type == 'dvd':
             mediainfo_json = rls.primary_ifo_info['mediainfo_json']
         else:
-            args = '"{mediainfo_bin_location}" --Output=JSON "{info_file}"'.format(
-                mediainfo_bin_location=Settings.paths['mediainfo_bin_path'],
-                info_file=rls.main_video_files[0]
-            )
-            mediainfo_json = subprocess.check_output(args, shell=True).decode()
-            mediainfo_json = json.loads(mediainfo_json)
+            mediainfo_json = MediaProbe.get_summary(rls.main_video_files[0], self.settings)
 
         video_info = self._get_video_data(mediainfo_json)
 
@@ -121,24 +603,9 @@ class ScreenshotGenerator:
 
         return display_width, display_height
 
-    def _keep_n_largest(self, saved_images):
-        """
-        # Smallest JPG files will contain the least detail - the 2 smallest will be discarded.
-        # This will keep the largest JPG files' respective PNG files (from which they were compressed), and upload them
-        :param saved_images: (list) of file paths (str)
-        :return: (list) of file paths (str)
-        """
-        for i, _ in enumerate(saved_images):
-            for k in range(i + 1, len(saved_images)):
-                if saved_images[i]['size'] < saved_images[k]['size']:
-                    saved_images[k], saved_images[i] = saved_images[i], saved_images[k]
-
-        for i, file in enumerate(saved_images):
-            os.unlink(file['path'] + '.jpg')
-            if i >= self.n_images:
-                os.unlink(file['path'] + '.png')
-
-        return [f['path'] + '.png' for f in saved_images[0:self.n_images]]
+    @staticmethod
+    def _get_file_size(file):
+        return os.path.getsize(file) if os.path.isfile(file) else 0
 
     def _get_video_data(self, mediainfo_json):
         for track in mediainfo_json['media']['track']:
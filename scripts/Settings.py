@@ -26,6 +26,76 @@ IMAGE_HOSTS_SKELETON = [
         'default': False
     }
 ]
+# tuning values that are never queried from the user; missing keys are filled in with these defaults
+PERFORMANCE_DEFAULTS = {
+    # extract every timestamp of a file with one ffmpeg invocation
+    'single_pass_extraction': True,
+    # number of ffmpeg extraction jobs that run at the same time
+    'extraction_workers': 4,
+    # n_images * candidate_multiplier low-resolution candidates are scored; only the best are extracted in full
+    'candidate_multiplier': 3,
+    'candidate_width': 320,
+    # concurrent uploads per image host, request timeout in seconds, and retries with exponential backoff
+    'upload_workers': 4,
+    'upload_timeout': 60,
+    'upload_retries': 3,
+    'upload_backoff': 1.0,
+    # '' uploads to the chosen host only; 'race' or 'failover' upload to the ranked upload_hosts (empty means
+    # every configured host, ranked by their rolling latency and error statistics)
+    'upload_fanout': '',
+    'upload_hosts': [],
+    'upload_failover_secs': 30,
+    # hdbimg galleries whose request would be larger than this are uploaded in several requests (0: no limit)
+    'hdbimg_max_request_bytes': 100 * 1024 * 1024,
+    # uploaded image urls are reused for identical images until they are this old
+    'upload_index_ttl_days': 30,
+    # lossless re-compression of screenshots before upload, in the host's preferred format; hdbimg galleries are
+    # encoded encode_workers images at a time, the other hosts per upload worker
+    'encode_images': True,
+    'encode_workers': 4,
+    'encode_palette': True,
+    # zlib level 9 costs about three times the CPU of level 6 for well under 1% smaller screenshots; libwebp
+    # effort (0-6) above 1 is slower for almost no gain on lossless frames
+    'png_compress_level': 6,
+    'webp_method': 1,
+    # batch mode: concurrent releases per stage, and where the per-release results are written
+    # (empty means the image save directory)
+    'batch_probe_workers': 2,
+    'batch_extract_workers': 1,
+    'batch_upload_workers': 2,
+    'batch_output_dir': '',
+    # pack mode: screenshots per episode; 0 spreads the usual number of screenshots over the whole pack
+    'pack_images_per_episode': 0,
+    # watch mode: seconds between directory scans without inotify, seconds a release has to stay unchanged before
+    # it is processed, and where the results are written (empty means next to each release)
+    'watch_poll_secs': 10,
+    'watch_settle_secs': 30,
+    'watch_output_dir': '',
+    # directory for all on-disk caches; empty means a 'cache' folder next to the scripts
+    'cache_dir': '',
+    'probe_cache_max_bytes': 16 * 1024 * 1024,
+    # mediainfo probes that run at the same time, e.g. for DVD IFO files the native reader can't parse
+    'probe_workers': 4,
+    # snap screenshot timestamps to keyframes found by a cached ffprobe packet scan
+    'keyframe_index': True,
+    'keyframe_cache_max_bytes': 64 * 1024 * 1024,
+    # place timestamps on a cached whole-file timeline (keyframes only, decoded at 64x36) instead of scoring
+    # decoded candidates; the first run of a file decodes every keyframe once
+    'timeline_analysis': False,
+    'timeline_cache_max_bytes': 16 * 1024 * 1024,
+    # journal the completed stages of every release, so a failed run resumes where it stopped; extracted
+    # screenshots are cached by video file, timestamp and dimensions
+    'job_journal': True,
+    'screenshot_cache_max_bytes': 512 * 1024 * 1024,
+    # reuse mediainfo and image urls for identical content under another path (hardlinks, copies)
+    'fingerprint_index': True,
+    'fingerprint_index_max_bytes': 16 * 1024 * 1024,
+    # contact sheet mode: frames in the grid, grid columns, width of one tile, and timestamp labels on every tile
+    'contact_sheet_frames': 12,
+    'contact_sheet_columns': 3,
+    'contact_sheet_tile_width': 480,
+    'contact_sheet_labels': True
+}
 
 
 class Settings:
@@ -41,6 +111,7 @@ class Settings:
     image_hosts = IMAGE_HOSTS_SKELETON
     print_not_copy = False
     use_bbcode_tags = False
+    performance = dict(PERFORMANCE_DEFAULTS)
 
     @staticmethod
     def load_settings():
@@ -51,6 +122,7 @@ class Settings:
             Settings.image_hosts = settings_from_file['image_hosts']
             Settings.print_not_copy = settings_from_file.get('print_not_copy')
             Settings.use_bbcode_tags = settings_from_file.get('use_bbcode_tags')
+            Settings.performance = {**PERFORMANCE_DEFAULTS, **settings_from_file.get('performance', {})}
 
             Settings._append_missing_settings(settings_from_file)
             Settings._expand_paths()
@@ -138,7 +210,8 @@ class Settings:
             'paths': Settings.paths,
             'image_hosts': Settings.image_hosts,
             'print_not_copy': Settings.print_not_copy,
-            'use_bbcode_tags': Settings.use_bbcode_tags
+            'use_bbcode_tags': Settings.use_bbcode_tags,
+            'performance': Settings.performance
         }
 
     # Query preferred host from user. Returns index number of host in list
@@ -206,6 +279,10 @@ class Settings:
             is_missing_settings = True
             Settings._query_bbcode_tags()
 
+        # performance values are not queried; the defaults are simply written to the file
+        if any(key not in settings_from_file.get('performance', {}) for key in PERFORMANCE_DEFAULTS):
+            is_missing_settings = True
+
         if is_missing_settings:
             with open(Settings.settings_file_path, 'w', encoding='utf8') as f:
                 json.dump(Settings._get_settings_dict(), f, indent=4)
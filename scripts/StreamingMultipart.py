@@ -0,0 +1,145 @@
+import base64
+import os
+import uuid
+
+# bytes read from a file at a time; a multiple of 3, so every chunk of a base64 part encodes on its own
+CHUNK_SIZE = 3 * 64 * 1024
+
+
+class StreamingMultipart:
+    """
+    multipart/form-data request body that is read from disk while it is being sent, so memory use stays at about
+    one chunk however large the files are. Its length is known up front, so it goes out with a Content-Length
+    header. Files are opened one at a time, when their part is reached, and closed once it has been read, on
+    seek(0), or on close()
+    """
+    def __init__(self, fields=(), files=(), base64_files=()):
+        """
+        :param fields: (list) of (name, value) tuples of form fields; values are str
+        :param files: (list) of (name, filename, file path) tuples of files sent as they are
+        :param base64_files: (list) of (name, file path) tuples of files sent base64-encoded, as plain form fields
+        """
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+
+        # bytes, or (file path, is_base64) for file contents
+        self._parts = []
+        for name, value in fields:
+            self._parts.append(self._get_part_header(name) + str(value).encode() + b'\r\n')
+        for name, filename, filepath in files:
+            self._parts.append(self._get_part_header(name, filename))
+            self._parts.append((filepath, False))
+            self._parts.append(b'\r\n')
+        for name, filepath in base64_files:
+            self._parts.append(self._get_part_header(name))
+            self._parts.append((filepath, True))
+            self._parts.append(b'\r\n')
+        self._parts.append(f'--{self.boundary}--\r\n'.encode())
+
+        self._length = sum(StreamingMultipart._get_part_length(part) for part in self._parts)
+        self._part_index = 0
+        self._position = 0
+        self._buffer = b''
+        self._fd = None
+        self._is_aborted = False
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read(self, size=-1):
+        """
+        :param size: (int) most bytes to return; negative reads the rest of the body, which defeats the purpose
+        :return: (bytes) empty once the whole body has been read
+        """
+        if self._is_aborted:
+            raise RuntimeError('Request body aborted')
+
+        chunks = []
+        n_read = 0
+        while size < 0 or n_read < size:
+            if not self._buffer and not self._fill_buffer():
+                break
+            n_wanted = len(self._buffer) if size < 0 else size - n_read
+            chunk, self._buffer = self._buffer[:n_wanted], self._buffer[n_wanted:]
+            chunks.append(chunk)
+            n_read += len(chunk)
+
+        self._position += n_read
+        return b''.join(chunks)
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """
+        Only rewinding to the start is supported, e.g. to send the body again after a failed attempt
+        """
+        assert offset == 0 and whence == os.SEEK_SET, 'StreamingMultipart can only be rewound to the start'
+        self.close()
+        self._part_index = 0
+        self._position = 0
+        self._buffer = b''
+        return 0
+
+    def abort(self):
+        """
+        Makes every further read raise, so a request that is being sent stops at its next chunk. Unlike close(),
+        can be called from another thread than the one sending the body
+        """
+        self._is_aborted = True
+
+    def close(self):
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+
+    def _fill_buffer(self):
+        """
+        :return: (bool) False once every part has been read
+        """
+        while self._part_index < len(self._parts):
+            part = self._parts[self._part_index]
+            if isinstance(part, bytes):
+                self._buffer = part
+                self._part_index += 1
+                return True
+
+            filepath, is_base64 = part
+            if self._fd is None:
+                self._fd = open(filepath, 'rb')
+            data = self._fd.read(CHUNK_SIZE)
+            if data:
+                self._buffer = base64.b64encode(data) if is_base64 else data
+                return True
+            self.close()
+            self._part_index += 1
+        return False
+
+    def _get_part_header(self, name, filename=None):
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+            return f'--{self.boundary}\r\nContent-Disposition: {disposition}\r\n' \
+                   f'Content-Type: application/octet-stream\r\n\r\n'.encode()
+        return f'--{self.boundary}\r\nContent-Disposition: {disposition}\r\n\r\n'.encode()
+
+    @staticmethod
+    def _get_part_length(part):
+        if isinstance(part, bytes):
+            return len(part)
+        filepath, is_base64 = part
+        size = os.path.getsize(filepath)
+        return 4 * ((size + 2) // 3) if is_base64 else size
@@ -0,0 +1,189 @@
+import bisect
+import io
+import re
+import subprocess
+import tempfile
+import threading
+
+import Helper
+from DiskCache import DiskCache
+from KeyframeIndex import KeyframeIndex
+from LruMemo import LruMemo
+from Profiler import Profiler
+from Settings import Settings
+
+# keyframes are decoded at this size; enough for brightness and scene statistics
+TIMELINE_WIDTH = 64
+TIMELINE_HEIGHT = 36
+# segments darker than this mean luma, or flatter than this luma deviation, are black/fade/title-card frames
+BLACK_FRAME_MAX_LUMA = 20
+FLAT_FRAME_MAX_STDDEV = 6
+# a decoded frame belongs to a keyframe if their times are at most this far apart
+KEYFRAME_MATCH_SECS = 0.02
+SHOWINFO_PTS_TIME_REGEX = re.compile(r'\bpts_time:\s*(-?[\d.]+)')
+
+
+class TimelineAnalyzer:
+    """
+    Whole-file timeline of a video: one segment per keyframe, starting at the keyframe times of KeyframeIndex, with
+    its brightness (mean luma), contrast (luma deviation), scene change against the previous keyframe and amount
+    of detail. Built with a single ffmpeg pass that decodes only keyframes, downscaled to grayscale, and cached on
+    disk as a small numpy archive keyed by path, size and mtime, so later runs pick good frames without decoding
+    """
+    _memo = LruMemo()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_timeline(file, settings=Settings):
+        """
+        :param file: file path (str)
+        :param settings: Settings, or a Config
+        :return: (dict) of equally long numpy arrays 'times', 'brightness', 'contrast', 'scene_change' and 'detail',
+                 or None if the file has no keyframe index or could not be decoded
+        """
+        import numpy as np
+
+        key = Helper.get_file_key(file)
+
+        with TimelineAnalyzer._lock:
+            if key in TimelineAnalyzer._memo:
+                return TimelineAnalyzer._memo[key]
+        disk_cache = DiskCache.get_shared('timelines', settings.performance['timeline_cache_max_bytes'], settings)
+
+        sidecar = disk_cache.get(key)
+        if sidecar is not None:
+            with np.load(io.BytesIO(sidecar)) as archive:
+                timeline = {name: archive[name] for name in archive.files}
+        else:
+            timeline = TimelineAnalyzer._analyze(file, settings)
+            if timeline is None:
+                return None
+            buffer = io.BytesIO()
+            np.savez_compressed(buffer, **timeline)
+            disk_cache.put(key, buffer.getvalue())
+
+        with TimelineAnalyzer._lock:
+            TimelineAnalyzer._memo[key] = timeline
+        return timeline
+
+    @staticmethod
+    def get_usable(timeline):
+        """
+        :return: (numpy.ndarray) bool per segment; False for black and flat segments, and for the segments right
+                 next to them, which are usually fades
+        """
+        import numpy as np
+
+        dark = (timeline['brightness'] < BLACK_FRAME_MAX_LUMA) | (timeline['contrast'] < FLAT_FRAME_MAX_STDDEV)
+        near_dark = dark.copy()
+        near_dark[1:] |= dark[:-1]
+        near_dark[:-1] |= dark[1:]
+        return np.logical_not(near_dark)
+
+    @staticmethod
+    def pick(timeline, start, end):
+        """
+        :param start: (float) seconds
+        :param end: (float) seconds
+        :return: (float) time of the usable segment between start and end with the most detail, new shots
+                 preferred; None if there is none
+        """
+        import numpy as np
+
+        times = timeline['times']
+        in_window = (times >= start) & (times < end) & TimelineAnalyzer.get_usable(timeline)
+        if not in_window.any():
+            return None
+        scores = np.where(in_window, timeline['detail'] * (1.0 + timeline['scene_change']), -1.0)
+        return float(times[int(np.argmax(scores))])
+
+    @staticmethod
+    def _analyze(file, settings):
+        import numpy as np
+
+        keyframes = KeyframeIndex.get_keyframes(file, settings)
+        if not keyframes:
+            return None
+
+        # showinfo reports the time of every decoded frame on stderr
+        args = '"{ffmpeg_bin_location}" -hide_banner -loglevel info -skip_frame nokey -i "{file}" -map 0:v:0 ' \
+               '-vf "showinfo,scale={width}:{height}" -vsync 0 -f rawvideo -pix_fmt gray pipe:1'.format(
+            ffmpeg_bin_location=settings.paths['ffmpeg_bin_path'],
+            file=file,
+            width=TIMELINE_WIDTH,
+            height=TIMELINE_HEIGHT
+        )
+        frame_size = TIMELINE_WIDTH * TIMELINE_HEIGHT
+        statistics = []
+        previous = None
+
+        with Profiler.span('ffmpeg', 'subprocess', mode='timeline', path=file) as info, \
+                tempfile.TemporaryFile() as frame_log:
+            # frames are consumed as they are decoded, so memory does not grow with the length of the file; stderr
+            # goes to a file, so a full pipe can't stall ffmpeg
+            process = subprocess.Popen(args, shell=True, stdout=subprocess.PIPE, stderr=frame_log)
+            try:
+                while True:
+                    raw_frame = process.stdout.read(frame_size)
+                    if len(raw_frame) < frame_size:
+                        break
+                    luma = np.frombuffer(raw_frame, dtype=np.uint8).reshape(TIMELINE_HEIGHT, TIMELINE_WIDTH)
+                    luma = luma.astype(np.float32)
+                    statistics.append(TimelineAnalyzer._get_statistics(luma, previous))
+                    previous = luma
+            finally:
+                # ffmpeg stops on the closed pipe if it still had frames
+                process.stdout.close()
+                process.wait()
+            info['bytes_in'] = len(statistics) * frame_size
+            frame_log.seek(0)
+            frame_times = [float(t) for t in SHOWINFO_PTS_TIME_REGEX.findall(frame_log.read().decode(errors='replace'))]
+
+        # an analysis whose frames can't all be placed is not cached; screenshots then fall back to the sampler
+        if not statistics or len(frame_times) != len(statistics):
+            return None
+        segments = {}
+        for keyframe, segment in zip(TimelineAnalyzer._match_keyframes(frame_times, keyframes), statistics):
+            if keyframe is not None:
+                segments.setdefault(keyframe, segment)
+        if not segments:
+            return None
+
+        times = sorted(segments)
+        timeline = {'times': np.array(times, dtype=np.float64)}
+        for i, name in enumerate(('brightness', 'contrast', 'scene_change', 'detail')):
+            timeline[name] = np.array([segments[time][i] for time in times], dtype=np.float32)
+        return timeline
+
+    @staticmethod
+    def _match_keyframes(frame_times, keyframes):
+        """
+        Pairs every decoded frame with the keyframe at its own time. The decoder also returns I-frames that the
+        container does not flag as sync points (e.g. open-GOP I-frames); they match no keyframe
+        :param frame_times: (list) times (float) of the decoded frames, as reported by showinfo
+        :param keyframes: (list) sorted KeyframeIndex times (float)
+        :return: (list) matching keyframe time, or None, per decoded frame
+        """
+        # ffmpeg counts from the start of the file, KeyframeIndex from the first video packet; both start with the
+        # first keyframe
+        offset = frame_times[0] - keyframes[0]
+        matches = []
+        for frame_time in frame_times:
+            frame_time -= offset
+            i = bisect.bisect_left(keyframes, frame_time)
+            nearest = min(keyframes[max(0, i - 1):i + 1], key=lambda keyframe: abs(keyframe - frame_time))
+            matches.append(nearest if abs(nearest - frame_time) <= KEYFRAME_MATCH_SECS else None)
+        return matches
+
+    @staticmethod
+    def _get_statistics(luma, previous):
+        """
+        :param luma: (numpy.ndarray) 2d float32 array of a keyframe
+        :param previous: the array of the keyframe before it, or None
+        :return: (tuple) brightness, contrast, scene change (0-1) and detail (log Laplacian variance)
+        """
+        import numpy as np
+
+        laplacian = 4 * luma[1:-1, 1:-1] - luma[:-2, 1:-1] - luma[2:, 1:-1] - luma[1:-1, :-2] - luma[1:-1, 2:]
+        scene_change = 1.0 if previous is None else float(np.abs(luma - previous).mean() / 255)
+        return float(luma.mean()), float(luma.std()), scene_change, float(np.log1p(laplacian.var()))
@@ -0,0 +1,70 @@
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import Helper
+from Settings import Settings
+
+
+class UploadIndex:
+    """
+    Local SQLite index mapping an image's content hash and image host to the urls that host returned, so
+    identical screenshots are not uploaded twice. Entries expire after upload_index_ttl_days. Every method that
+    touches the index takes the Settings, or a Config, to use as settings=
+    """
+    file_name = 'uploads.sqlite3'
+
+    @staticmethod
+    def hash_file(file):
+        sha256 = hashlib.sha256()
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    @staticmethod
+    def get(content_hash, host_name, settings=Settings):
+        min_created = time.time() - settings.performance['upload_index_ttl_days'] * 86400
+        with UploadIndex._connect(settings) as conn:
+            row = conn.execute('SELECT urls FROM uploads WHERE content_hash = ? AND host = ? AND created >= ?',
+                               (content_hash, host_name, min_created)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    @staticmethod
+    def put(content_hash, host_name, urls, settings=Settings):
+        with UploadIndex._connect(settings) as conn:
+            conn.execute('INSERT OR REPLACE INTO uploads (content_hash, host, urls, created) VALUES (?, ?, ?, ?)',
+                         (content_hash, host_name, json.dumps(urls), time.time()))
+
+    @staticmethod
+    def purge(max_age_days=None, settings=Settings):
+        """
+        Deletes entries older than max_age_days
+        :param max_age_days: (float) defaults to the upload_index_ttl_days setting, i.e. all expired entries
+        :return: (int) number of deleted entries
+        """
+        if max_age_days is None:
+            max_age_days = settings.performance['upload_index_ttl_days']
+
+        with UploadIndex._connect(settings) as conn:
+            cursor = conn.execute('DELETE FROM uploads WHERE created < ?', (time.time() - max_age_days * 86400,))
+            n_deleted = cursor.rowcount
+        return n_deleted
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _connect(settings):
+        # a connection per call keeps the index safe to use from the upload worker threads
+        os.makedirs(Helper.get_cache_dir(settings), exist_ok=True)
+        conn = sqlite3.connect(os.path.join(Helper.get_cache_dir(settings), UploadIndex.file_name), timeout=30)
+        try:
+            with conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS uploads ('
+                             'content_hash TEXT NOT NULL, host TEXT NOT NULL, urls TEXT NOT NULL, '
+                             'created REAL NOT NULL, PRIMARY KEY (content_hash, host))')
+                yield conn
+        finally:
+            conn.close()
@@ -0,0 +1,136 @@
+import json
+import os
+import time
+
+import Helper
+from BatchScheduler import BatchScheduler
+from Settings import Settings
+
+
+class WatchDaemon:
+    """
+    Watches incoming directories and runs every new release through BatchScheduler once it has stopped changing.
+    The process stays alive between releases, so settings, imports, the HTTP session and the probe caches stay warm.
+    Directory changes are picked up with inotify when the optional inotify_simple package is installed, otherwise
+    by polling. Releases that were processed are remembered in a state file, so restarts don't process them again
+    """
+    def __init__(self, watch_dirs, image_host_id, output_dir='', contact_sheet=False, pack_mode='',
+                 settings=Settings):
+        """
+        :param watch_dirs: (list) of directory paths (str)
+        :param output_dir: (str) outbox directory for the results; empty means next to each release
+        :param settings: Settings, or a Config
+        """
+        self.watch_dirs = [os.path.abspath(d) for d in watch_dirs]
+        for watch_dir in self.watch_dirs:
+            assert os.path.isdir(watch_dir), f'Error: {watch_dir} is not a directory'
+
+        self.settings = settings
+        self.image_host_id = image_host_id
+        self.output_dir = os.path.expanduser(output_dir or settings.performance['watch_output_dir'])
+        self.contact_sheet = contact_sheet
+        self.pack_mode = pack_mode
+
+        self.state_filepath = os.path.join(Helper.get_cache_dir(settings), 'watch_state.json')
+        # release path -> signature when it was processed; failed releases are retried once they change again
+        self.processed = self._load_state()
+        self.failed = {}
+        # release path -> (signature, time it was first seen with that signature)
+        self.pending = {}
+
+    def run(self):
+        inotify = self._create_inotify()
+        print('Watching {} ({})'.format(', '.join(self.watch_dirs), 'inotify' if inotify else 'polling'))
+
+        try:
+            while True:
+                ready_paths = self._get_ready_paths()
+                if ready_paths:
+                    self._process(ready_paths)
+                    continue
+
+                timeout = self.settings.performance['watch_poll_secs']
+                if self.pending:
+                    timeout = min(timeout, self.settings.performance['watch_settle_secs'])
+                if inotify:
+                    inotify.read(timeout=int(timeout * 1000))
+                else:
+                    time.sleep(timeout)
+        except KeyboardInterrupt:
+            print('Stopped watching')
+        finally:
+            if inotify:
+                inotify.close()
+
+    def _get_ready_paths(self):
+        """
+        :return: (list) of release paths whose contents have not changed for watch_settle_secs
+        """
+        now = time.monotonic()
+        release_paths = BatchScheduler._expand_input_paths(self.watch_dirs)
+        self.pending = {path: self.pending[path] for path in release_paths if path in self.pending}
+
+        ready_paths = []
+        for path in release_paths:
+            signature = Helper.get_path_signature(path)
+            if signature is None or signature == self.processed.get(path) or signature == self.failed.get(path):
+                continue
+
+            pending_signature, since = self.pending.get(path, (None, now))
+            if pending_signature != signature:
+                self.pending[path] = (signature, now)
+            elif now - since >= self.settings.performance['watch_settle_secs']:
+                del self.pending[path]
+                ready_paths.append((path, signature))
+        return ready_paths
+
+    def _process(self, ready_paths):
+        # releases that share an output directory go through one scheduler, so their stages overlap
+        by_output_dir = {}
+        for path, signature in ready_paths:
+            by_output_dir.setdefault(self.output_dir or os.path.dirname(path), []).append((path, signature))
+
+        for output_dir, releases in by_output_dir.items():
+            paths = [path for path, _ in releases]
+            # the paths are releases already; expanding them again would split a folder into its video files
+            failed_paths = BatchScheduler(paths, self.image_host_id, output_dir=output_dir,
+                                          contact_sheet=self.contact_sheet, pack_mode=self.pack_mode,
+                                          settings=self.settings, expand_input_paths=False).run()
+            for path, signature in releases:
+                if path in failed_paths:
+                    self.failed[path] = signature
+                else:
+                    self.processed[path] = signature
+        self._save_state()
+
+    def _create_inotify(self):
+        """
+        :return: inotify_simple.INotify watching every watch directory, or None if inotify is not available
+        """
+        try:
+            from inotify_simple import INotify, flags
+        except ImportError:
+            return None
+
+        try:
+            inotify = INotify()
+            watch_flags = flags.CREATE | flags.CLOSE_WRITE | flags.MOVED_TO | flags.DELETE
+            for watch_dir in self.watch_dirs:
+                inotify.add_watch(watch_dir, watch_flags)
+        except OSError:
+            return None
+        return inotify
+
+    def _load_state(self):
+        try:
+            with open(self.state_filepath, 'r', encoding='utf8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(self.state_filepath), exist_ok=True)
+        temp_filepath = self.state_filepath + '.tmp'
+        with open(temp_filepath, 'w', encoding='utf8') as f:
+            json.dump(self.processed, f, indent=4)
+        os.replace(temp_filepath, self.state_filepath)